@@ -94,11 +94,12 @@ export default function Chat({ medications: propMeds }: { medications?: any[] })
         ? `The user's medications are: ${medications.map(m => m.name).join(', ')}.`
         : "";
 
+      const userId = await AsyncStorage.getItem('user_id');
       const response = await fetch(`${BACKEND_API_HOST}/chatbot`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
-          user_id: "test_user",
+          user_id: userId ?? "anonymous",
           message: input,
           chat_history: messages.reduce<[string, string][]>((acc, cur, i, arr) => {
             if (cur.sender === "user" && arr[i+1]?.sender === "bot") {
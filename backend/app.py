@@ -1,24 +1,53 @@
 import os
 import json
+import base64
+import binascii
+import time
+import math
+import uuid
+import asyncio
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import BackgroundTasks, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.datastructures import UploadFile as FormFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
-from langchain.schema.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.output_parsers.json import SimpleJsonOutputParser
-from typing import List, Tuple
-from huaweicloudsdkcore.auth.credentials import BasicCredentials
-from huaweicloudsdkocr.v1.region.ocr_region import OcrRegion
-from huaweicloudsdkcore.exceptions import exceptions
-from huaweicloudsdkocr.v1 import *
-
-print("[APP] Initializing FastAPI application...")
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Literal, Optional, Sequence, Tuple
+
+# Before the local imports: telemetry reads its logging and tracing settings when imported
+load_dotenv()
+
+from ocr_client import OcrService
+from ocr_cache import create_ocr_cache
+from image_prep import prepare_image_for_ocr
+from usage import average_call_tokens, cache_hit_rate, format_usage, record_usage, start_request_usage, usage_totals
+from llm_scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_SAFETY,
+    LLMOverloaded, LLMScheduler, rate_limit_observer, set_request_user
+)
+from prescreen import ResponsePreScreener, needs_revision
+from med_label_parser import MED_INFO_KEYS, parse_med_label
+from sessions import ChatSession, append_turn, count_turn_tokens, create_session_store, load_token_encoding, pop_turns_over_budget
+from telemetry import evaluator_fallbacks, get_logger, redact, render_metrics, revisions_triggered, stage
+
+log = get_logger("app")
+log.info("Initializing FastAPI application")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the LLM stack and OCR client in the background so the worker answers
+    # /healthz straight away; /readyz reports when it can take traffic
+    ensure_llm_task()
+    ensure_ocr_service_task()
+    yield
+    if ocr_service is not None:
+        ocr_service.close()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for all routes
 origins = ["*"] # To be updated (should be restricted in production)
@@ -30,29 +59,81 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-# Load environment variables
-load_dotenv()
+# Environment variables were loaded before the local imports above
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TESSERACT_PATH = os.getenv("TESSERACT_PATH")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Starting budgets for the OpenAI account; adjusted to the x-ratelimit-* headers OpenAI returns
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+# Beyond these, LLM calls are refused straight away (chat endpoints answer 429) instead of queueing
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "4"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "20"))
+CHAT_STREAM_MODE = os.getenv("CHAT_STREAM_MODE", "gated")
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".sessions")
+# Placeholder ids several people may send; these never get a server-side session
+SHARED_USER_IDS = {u.strip() for u in os.getenv("SHARED_USER_IDS", "test_user,anonymous").split(",") if u.strip()}
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# History is compacted down to this many tokens once it goes over budget
+CHAT_HISTORY_TOKEN_TARGET = int(os.getenv("CHAT_HISTORY_TOKEN_TARGET", str(CHAT_HISTORY_TOKEN_BUDGET // 2)))
+OCR_BACKEND = os.getenv("OCR_BACKEND", "huawei")
+OCR_REGION = os.getenv("OCR_REGION", "ap-southeast-1")
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "8"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "15"))
+OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "2"))
+OCR_MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# Room for the multipart boundaries and part headers around the image itself
+OCR_UPLOAD_ENVELOPE_BYTES = 64 * 1024
+# Longest side uploaded photos are downscaled to before OCR, plenty for label-sized text
+OCR_MAX_IMAGE_SIDE = int(os.getenv("OCR_MAX_IMAGE_SIDE", "2048"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+OCR_BATCH_MAX_IMAGES = int(os.getenv("OCR_BATCH_MAX_IMAGES", "10"))
+# How many of a batch's images are OCR'd at once, and how many labels go into one extraction call
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", "4"))
+OCR_BATCH_EXTRACT_SIZE = int(os.getenv("OCR_BATCH_EXTRACT_SIZE", "5"))
+OCR_CACHE_BACKEND = os.getenv("OCR_CACHE_BACKEND", "memory")
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", ".cache/ocr_cache.sqlite3")
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", str(7 * 24 * 3600)))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "5000"))
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() == "true"
+# Earlier user messages the pre-screen also checks for red flags
+PRESCREEN_CONTEXT_TURNS = int(os.getenv("PRESCREEN_CONTEXT_TURNS", "3"))
+MED_LABEL_PARSER_ENABLED = os.getenv("MED_LABEL_PARSER_ENABLED", "true").lower() == "true"
+# "standard": generate, evaluate, then revise if flagged
+# "self_check": one structured call returns the reply and its own evaluation, revising only if that fails
+CHAT_PIPELINE_MODE = os.getenv("CHAT_PIPELINE_MODE", "standard")
+# "openai" | "fake" (canned local replies, no API key needed)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
 
-# Initializing LLM
-print("[APP] Initializing LLM...")
-
-llm = ChatOpenAI(
-    temperature=0.2,
-    model_name="gpt-4o"
+# Every LLM call goes through this: it caps in-flight calls per worker, keeps within the
+# account's rate limits, and shares the queue fairly between users when a burst arrives
+llm_scheduler = LLMScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_queue=LLM_MAX_QUEUE,
+    max_queue_per_user=LLM_MAX_QUEUE_PER_USER,
+    max_wait=LLM_MAX_QUEUE_WAIT,
+    # Until a chain has reported usage, assume a companion-sized prompt
+    token_estimator=lambda chain: average_call_tokens(chain, default=1500)
 )
 
-print("[APP] LLM initialized.")
+session_store = create_session_store(SESSION_STORE, SESSION_STORE_PATH)
 
 """ Chatbot endpoint """
 class ChatRequest(BaseModel):
     user_id: str
     message: str
+    # Conversation state lives server-side, so this may be left empty. When it is sent
+    # it wins over a stored session it doesn't continue, and it is the only history
+    # used for shared placeholder ids.
     chat_history: List[Tuple[str, str]] = []
 
 def format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
     """Format chat history into a string format"""
+    from langchain_core.messages import AIMessage, HumanMessage
     if not chat_history:
         return []
     formatted_history = []
@@ -64,6 +145,8 @@ def format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
 # LLM Evaluator
 class LLMEvaluator:
     def __init__(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers.json import SimpleJsonOutputParser
         self.llm = llm
         self.parser = SimpleJsonOutputParser()
         self.prompt = ChatPromptTemplate.from_messages([
@@ -122,16 +205,43 @@ class LLMEvaluator:
             )),
              ("human", "User message:\n{user_msg}\n\nProposed response:\n{initial_response}\n\nEvaluate the proposed response to the user's message.")
         ])
+        self.chain = self.prompt | self.llm
 
-    def run_evaluator_chain(self, user_msg: str, initial_response: str) -> dict:
-        print(f"[LLM EVALUATOR] Evaluating initial chatbot response...")
+    async def run_evaluator_chain(self, user_msg: str, initial_response: str, priority: int = PRIORITY_SAFETY,
+                                  fail_closed: bool = False) -> dict:
+        """
+        Evaluate the response. If the evaluator fails the response passes unchecked,
+        unless `fail_closed` is set for a safety-relevant turn, in which case it is
+        treated as unsafe so that it gets revised.
+        """
+        log.debug("Evaluating initial chatbot response")
         try:
-            chain = self.prompt | self.llm | self.parser
-            result = chain.invoke({"user_msg": user_msg, "initial_response": initial_response})
-            print("[LLM EVALUATOR] Evaluation result: ", result)
+            async with llm_scheduler.slot("evaluator", priority), stage("evaluator"):
+                message = await self.chain.ainvoke({"user_msg": user_msg, "initial_response": initial_response})
+            record_usage("evaluator", message)
+            result = self.parser.invoke(message)
+            log.info("Evaluation result", extra={"evaluation": redact(result)})
             return result
+        except LLMOverloaded:
+            # Shedding load is not an evaluator failure, never pass the response unchecked for it
+            raise
         except Exception as e:
-            print("[ERROR] Failed to evaluate initial chatbot response: ", e)
+            evaluator_fallbacks.inc()
+            if fail_closed:
+                log.error("Failed to evaluate safety-relevant chatbot response, treating it as unsafe", extra={"error": str(e)})
+                return {
+                    "emotional_tone": True,
+                    "helpful": True,
+                    "safety_concern": True,
+                    "conciseness_length": True,
+                    "comments": {
+                        "emotional_tone": "No comments as evaluator failed to run",
+                        "helpful": "No comments as evaluator failed to run",
+                        "safety_concern": "Evaluator failed to run on a message with possible self-harm or dosing content, respond with extra care",
+                        "conciseness_length": "No comments as evaluator failed to run"
+                    }
+                }
+            log.error("Failed to evaluate initial chatbot response, passing it unchecked", extra={"error": str(e)})
             return {
                 "emotional_tone": True,
                 "helpful": True,
@@ -148,6 +258,7 @@ class LLMEvaluator:
 # LLM Revisor
 class LLMRevisor:
     def __init__(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
         self.llm = llm
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", (
@@ -169,225 +280,927 @@ class LLMRevisor:
                 "Revise the initially proposed chatbot response based on the evaluator feedback, ensuring relevance to the user's message."
              ))
         ])
+        self.chain = self.prompt | self.llm
 
-    def run_revisor_chain(self, user_msg: str, initial_response: str, evaluation_json: str) -> dict:
-        print(f"[LLM REVISOR] Revising initial chatbot response...")
+    async def run_revisor_chain(self, user_msg: str, initial_response: str, evaluation_json: str) -> str:
+        log.debug("Revising initial chatbot response")
         try:
-            chain = self.prompt | self.llm
-            result = chain.invoke({"user_msg": user_msg, "initial_response": initial_response, "evaluation_json": evaluation_json})
-            print("[LLM REVISOR] Revised chatbot response: ", result.content)
+            async with llm_scheduler.slot("revisor"), stage("revisor"):
+                result = await self.chain.ainvoke({"user_msg": user_msg, "initial_response": initial_response, "evaluation_json": evaluation_json})
+            record_usage("revisor", result)
+            log.info("Revised chatbot response", extra={"response": redact(result.content)})
             return result.content
+        except LLMOverloaded:
+            raise
         except Exception as e:
-            print("[ERROR] Failed to revise initial chatbot response, returning initial response: ", e)
-            return initial_response
+            # Handled like an overloaded revisor: the unrevised reply is only used if it wasn't flagged as unsafe
+            log.error("Failed to revise initial chatbot response", extra={"error": str(e)})
+            raise LLMOverloaded("revisor_failed", llm_scheduler.retry_after()) from e
 
-llm_evaluator = LLMEvaluator(llm)
-llm_revisor = LLMRevisor(llm)
+    async def stream_revisor_chain(self, user_msg: str, initial_response: str, evaluation_json: str) -> AsyncIterator[str]:
+        log.debug("Streaming revised chatbot response")
+        streamed_any = False
+        try:
+            aggregate = None
+            async with llm_scheduler.slot("revisor"), stage("revisor"):
+                async for chunk in self.chain.astream({"user_msg": user_msg, "initial_response": initial_response, "evaluation_json": evaluation_json}):
+                    aggregate = chunk if aggregate is None else aggregate + chunk
+                    if chunk.content:
+                        streamed_any = True
+                        yield chunk.content
+            record_usage("revisor", aggregate)
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            log.error("Failed to stream revised chatbot response", extra={"error": str(e)})
+            if not streamed_any:
+                raise LLMOverloaded("revisor_failed", llm_scheduler.retry_after()) from e
 
-@app.post("/chatbot")
-async def chat(req: ChatRequest):
+# History Summarizer
+class HistorySummarizer:
+    def __init__(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        self.llm = llm
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", (
+                "You maintain a running summary of a conversation between a youth user and their mental health companion chatbot.\n"
+                "Update the existing summary with the new conversation turns so the companion can keep personalising its support.\n\n"
+                "The summary must:\n"
+                "- Keep the user's name, age, medications, conditions, struggles, motivators and preferred tone\n"
+                "- Keep any safety concerns the user has raised\n"
+                "- Drop small talk and anything already covered\n"
+                "- Be at most 150 words\n\n"
+                "Return ONLY the updated summary as plain text."
+            )),
+             ("human", "Existing summary:\n{summary}\n\nNew conversation turns:\n{turns}\n\nUpdate the summary.")
+        ])
+        self.chain = self.prompt | self.llm
+
+    async def run_summarizer_chain(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        log.debug("Folding turns into summary", extra={"turns": len(turns)})
+        formatted_turns = "\n".join(f"User: {human}\nCompanion: {ai}" for human, ai in turns)
+        async with llm_scheduler.slot("summarizer", PRIORITY_BACKGROUND), stage("summarizer"):
+            result = await self.chain.ainvoke({"summary": summary or "None yet", "turns": formatted_turns})
+        record_usage("summarizer", result)
+        return result.content.strip()
+
+response_prescreener = ResponsePreScreener()
+# Pre-screen escalations whose evaluator call goes ahead of other queued LLM calls
+SAFETY_ESCALATIONS = {"safety_lexicon", "safety_context", "dosing_advice", "dosage_mentioned"}
+
+def recent_user_messages(session: ChatSession) -> List[str]:
+    return [human for human, _ in session.turns[-PRESCREEN_CONTEXT_TURNS:]] if PRESCREEN_CONTEXT_TURNS else []
+
+async def evaluate_response(user_msg: str, initial_response: str, recent_user_msgs: Sequence[str] = ()) -> dict:
+    """Run the local pre-screen first and only pay for the LLM evaluator when it can't decide"""
+    # Unscreened responses could be anything, so they get the safety priority too
+    priority = PRIORITY_SAFETY
+    fail_closed = False
+    if PRESCREEN_ENABLED:
+        async with stage("prescreen"):
+            result, reason = response_prescreener.screen(user_msg, initial_response, recent_user_msgs)
+        if result is not None:
+            log.info("Evaluated locally by pre-screen", extra={"evaluation": redact(result)})
+            return result
+        log.info("Pre-screen escalating to LLM evaluator", extra={"reason": reason})
+        fail_closed = reason in SAFETY_ESCALATIONS
+        priority = PRIORITY_SAFETY if fail_closed else PRIORITY_INTERACTIVE
+    return await llm_evaluator.run_evaluator_chain(user_msg, initial_response, priority, fail_closed)
+
+def session_from_history(user_id: str, client_history: List[Tuple[str, str]]) -> ChatSession:
+    turns = [tuple(turn) for turn in client_history]
+    return ChatSession(user_id=user_id, turns=turns, turn_tokens=[count_turn_tokens(turn) for turn in turns])
+
+def continues_session(session: ChatSession, client_history: List[Tuple[str, str]]) -> bool:
+    """The client's history ends with the turns the stored session still holds verbatim"""
+    if not session.turns:
+        return False
+    tail = [tuple(turn) for turn in client_history[-len(session.turns):]]
+    return tail == [tuple(turn) for turn in session.turns]
+
+async def load_session(user_id: str, client_history: List[Tuple[str, str]]) -> ChatSession:
+    if user_id in SHARED_USER_IDS:
+        # Nothing stored under a shared id, so one user's history and summary never reach another
+        return session_from_history(user_id, client_history)
+    session = await session_store.get(user_id)
+    if client_history and not continues_session(session, client_history):
+        if session.turns or session.summary:
+            log.info("Client history does not continue the stored session, using the client's")
+        session = session_from_history(user_id, client_history)
+    return session
+
+async def record_turn(user_id: str, user_msg: str, bot_response: str, client_history: List[Tuple[str, str]]):
+    """Append the finished turn to the session, then compact history that is over budget"""
+    if user_id in SHARED_USER_IDS:
+        return
+    async with session_store.lock(user_id):
+        session = await load_session(user_id, client_history)
+        append_turn(session, user_msg, bot_response)
+        # Saved before summarising, so the user's next message already sees this turn
+        await session_store.save(session)
+        compacted = session.model_copy(deep=True)
+        evicted = pop_turns_over_budget(compacted, CHAT_HISTORY_TOKEN_BUDGET, CHAT_HISTORY_TOKEN_TARGET)
+    if not evicted:
+        return
     try:
-        user_id = req.user_id
-        user_msg = req.message
-        chat_history = req.chat_history
+        summary = await history_summarizer.run_summarizer_chain(compacted.summary, evicted)
+    except Exception as e:
+        # Better to lose detail from the oldest turns than to let the history grow unbounded
+        log.error("Failed to summarise chat history", extra={"error": str(e)})
+        summary = compacted.summary
+    async with session_store.lock(user_id):
+        session = await session_store.get(user_id)
+        # Skip if another turn's compaction or a client reset changed the session meanwhile
+        if session.summary != compacted.summary or session.turns[:len(evicted)] != evicted:
+            return
+        del session.turns[:len(evicted)]
+        del session.turn_tokens[:len(evicted)]
+        session.summary = summary
+        await session_store.save(session)
 
-        print(f"[APP] Received message from {user_id}: {user_msg}")
-        print(f"[APP] Chat history length: {len(chat_history)}")
+# Static companion prompt, built once. It always goes first in the message list so the
+# prefix is byte-identical across users and turns, which is what OpenAI's prompt cache keys on.
+COMPANION_SYSTEM_PROMPT = (
+    "You are a kind, empathetic, and non-judgmental mental health companion designed to support youth in Singapore "
+    "managing psychiatric conditions like depression, anxiety, ADHD, and more.\n"
+    "You are not a doctor, but you are a trusted support tool that helps users reflect, log, and feel emotionally "
+    "safe while building habits like medication adherence and self-awareness.\n\n"
+    "Important Instructions:\n"
+    "1. Personalization:\n"
+    "You remember and personalize responses based on:\n"
+    "- User’s name, age, gender\n"
+    "- Medications and conditions\n"
+    "- Personality, communication style, and general outlook\n"
+    "- Their struggles, motivators, and preferred tone\n\n"
+    "2. Tone & Communication Style:\n"
+    "- Use a friendly and emotionally warm tone\n"
+    "- Responses should always be 1 to 3 sentences long\n"
+    "- Sound like a caring companion, not a clinician or scripted bot\n"
+    "- Validate feelings, ask thoughtful questions, and use gentle language\n"
+    "- Mirror the user’s tone where appropriate (e.g. light humour if they use it)\n\n"
+    "3. What You Can Do:\n"
+    "a. Daily Mental Health Support:\n"
+    "- Encourage and praise users for logging meds, journaling, mood check-ins\n"
+    """- Use small, meaningful affirmations (e.g. “That’s a win.” “You showed up today.”)\n"""
+    "b. Root Cause Reflection for Missed Doses:\n"
+    "- Don’t just give advice. Ask why the user missed a dose\n"
+    "- Explore barriers (e.g. forgot, stigma, stress, side effects, lack of motivation)\n"
+    "- Ask about their willingness to change or try new ideas\n"
+    "- Offer tailored, practical solutions based on their lifestyle and what they’re open to\n"
+    """- Example response: "Would combining the times you take your meds help make it feel less disruptive?"\n"""
+    "c. Medication Simplification (if safe):\n"
+    "- Where appropriate, help simplify routines (e.g. grouping meds at similar times, checking if meds can be taken with or without food)\n"
+    "- Always refer users to a pharmacist or doctor to confirm changes\n"
+    """- Example response: "Some people group their morning meds together if their doctor allows it — do you think that might work for you?"\n\n"""
+    "4. Medication Questions:\n"
+    "- For any drug-related information (e.g. what a med is for, how to take it), use Singapore’s official HealthHub website as your source and cite it accordingly.\n"
+    "- Always encourage users to double-check with their pharmacist or doctor before making any changes or if they are unsure.\n\n"
+    "5. Referral to Healthcare Professionals:\n"
+    "When a user has a concern outside your capabilities, refer them clearly and appropriately:\n"
+    "- Side effects, missed doses needing adjustment → Pharmacist or GP"
+    "- Mental health concerns or mood changes → Psychiatrist or GP\n"
+    "- Persistent low mood or functioning → Counsellor (e.g. School counsellor)\n"
+    "- Urgent safety concerns (e.g. suicidal thoughts) → A&E or emergency services\n"
+    """Example response: "I think this is something a pharmacist could guide you on more clearly — would you be open to asking them during your next visit?"\n\n"""
+    "6. Red Flag Safety (e.g. Suicide Ideation):\n"
+    "If a user expresses thoughts of suicide or harm:\n"
+    "- Do not dismiss or immediately redirect\n"
+    "- Stay with them in the conversation. Let them share, reflect, and feel heard\n"
+    "- Gently discourage impulsive action and offer space for expression\n"
+    "- Suggest seeking help from a trusted person or professional\n"
+    "- Refer to appropriate crisis or emergency care in a soft, non-threatening way\n"
+    "Example response: "
+    """"I hear how overwhelmed you're feeling — thank you for sharing that. You're not alone in this. """
+    """Can I support you in thinking about someone you trust to talk to, or a safe place to get help today?"\n\n"""
+    "7. Cultural Sensitivity:\n"
+    "- Assume you’re speaking to a youth in Singapore\n"
+    "- Use simple, clear English — no slang unless the user uses it\n"
+    "- Respond in Chinese, Malay, or Tamil if asked or when a user starts using one of those languages\n"
+    "- Be inclusive, gentle, and avoid assumptions about gender, religion, or family structure\n\n"
+    "8. Boundaries:\n"
+    "You do not:\n"
+    "- Diagnose\n"
+    "- Adjust dosages\n"
+    "- Give crisis counselling\n"
+    "- Interpret lab results or medical imaging\n"
+    "- Give legal, financial, or academic advice\n"
+    "When unsure, say:\n"
+    """"I want to support you, but this is something a professional can help with better. Would you be open to speaking with them?"\n\n"""
+    "9. Final Principle:\n"
+    "You are not here to fix the user. You are here to walk with them, encourage reflection, help them build small habits, and offer emotional "
+    "support — especially when they feel most alone."
+)
+@lru_cache(maxsize=None)
+def companion_system_message():
+    from langchain_core.messages import SystemMessage
+    return SystemMessage(content=COMPANION_SYSTEM_PROMPT)
 
-        history_messages = format_chat_history(chat_history)
+def build_chat_messages(user_msg: str, chat_history: List[Tuple[str, str]], summary: str = "") -> List:
+    """Build the companion prompt followed by the conversation so far and the new message"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    messages = [companion_system_message()]
+    # Per-user content only after the static prefix
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation with this user:\n{summary}"))
+    return messages + format_chat_history(chat_history) + [HumanMessage(content=user_msg)]
 
-        # Get initial response
-        system_prompt = (
-            "You are a kind, empathetic, and non-judgmental mental health companion designed to support youth in Singapore "
-            "managing psychiatric conditions like depression, anxiety, ADHD, and more.\n"
-            "You are not a doctor, but you are a trusted support tool that helps users reflect, log, and feel emotionally "
-            "safe while building habits like medication adherence and self-awareness.\n\n"
-            "Important Instructions:\n"
-            "1. Personalization:\n"
-            "You remember and personalize responses based on:\n"
-            "- User’s name, age, gender\n"
-            "- Medications and conditions\n"
-            "- Personality, communication style, and general outlook\n"
-            "- Their struggles, motivators, and preferred tone\n\n"
-            "2. Tone & Communication Style:\n"
-            "- Use a friendly and emotionally warm tone\n"
-            "- Responses should always be 1 to 3 sentences long\n"
-            "- Sound like a caring companion, not a clinician or scripted bot\n"
-            "- Validate feelings, ask thoughtful questions, and use gentle language\n"
-            "- Mirror the user’s tone where appropriate (e.g. light humour if they use it)\n\n"
-            "3. What You Can Do:\n"
-            "a. Daily Mental Health Support:\n"
-            "- Encourage and praise users for logging meds, journaling, mood check-ins\n"
-            """- Use small, meaningful affirmations (e.g. “That’s a win.” “You showed up today.”)\n"""
-            "b. Root Cause Reflection for Missed Doses:\n"
-            "- Don’t just give advice. Ask why the user missed a dose\n"
-            "- Explore barriers (e.g. forgot, stigma, stress, side effects, lack of motivation)\n"
-            "- Ask about their willingness to change or try new ideas\n"
-            "- Offer tailored, practical solutions based on their lifestyle and what they’re open to\n"
-            """- Example response: "Would combining the times you take your meds help make it feel less disruptive?"\n"""
-            "c. Medication Simplification (if safe):\n"
-            "- Where appropriate, help simplify routines (e.g. grouping meds at similar times, checking if meds can be taken with or without food)\n"
-            "- Always refer users to a pharmacist or doctor to confirm changes\n"
-            """- Example response: "Some people group their morning meds together if their doctor allows it — do you think that might work for you?"\n\n"""
-            "4. Medication Questions:\n"
-            "- For any drug-related information (e.g. what a med is for, how to take it), use Singapore’s official HealthHub website as your source and cite it accordingly.\n"
-            "- Always encourage users to double-check with their pharmacist or doctor before making any changes or if they are unsure.\n\n"
-            "5. Referral to Healthcare Professionals:\n"
-            "When a user has a concern outside your capabilities, refer them clearly and appropriately:\n"
-            "- Side effects, missed doses needing adjustment → Pharmacist or GP"
-            "- Mental health concerns or mood changes → Psychiatrist or GP\n"
-            "- Persistent low mood or functioning → Counsellor (e.g. School counsellor)\n"
-            "- Urgent safety concerns (e.g. suicidal thoughts) → A&E or emergency services\n"
-            """Example response: "I think this is something a pharmacist could guide you on more clearly — would you be open to asking them during your next visit?"\n\n"""
-            "6. Red Flag Safety (e.g. Suicide Ideation):\n"
-            "If a user expresses thoughts of suicide or harm:\n"
-            "- Do not dismiss or immediately redirect\n"
-            "- Stay with them in the conversation. Let them share, reflect, and feel heard\n"
-            "- Gently discourage impulsive action and offer space for expression\n"
-            "- Suggest seeking help from a trusted person or professional\n"
-            "- Refer to appropriate crisis or emergency care in a soft, non-threatening way\n"
-            "Example response: "
-            """"I hear how overwhelmed you're feeling — thank you for sharing that. You're not alone in this. """
-            """Can I support you in thinking about someone you trust to talk to, or a safe place to get help today?"\n\n"""
-            "7. Cultural Sensitivity:\n"
-            "- Assume you’re speaking to a youth in Singapore\n"
-            "- Use simple, clear English — no slang unless the user uses it\n"
-            "- Respond in Chinese, Malay, or Tamil if asked or when a user starts using one of those languages\n"
-            "- Be inclusive, gentle, and avoid assumptions about gender, religion, or family structure\n\n"
-            "8. Boundaries:\n"
-            "You do not:\n"
-            "- Diagnose\n"
-            "- Adjust dosages\n"
-            "- Give crisis counselling\n"
-            "- Interpret lab results or medical imaging\n"
-            "- Give legal, financial, or academic advice\n"
-            "When unsure, say:\n"
-            """"I want to support you, but this is something a professional can help with better. Would you be open to speaking with them?"\n\n"""
-            "9. Final Principle:\n"
-            "You are not here to fix the user. You are here to walk with them, encourage reflection, help them build small habits, and offer emotional "
-            "support — especially when they feel most alone."
-        )
-        messages = [SystemMessage(content=system_prompt)] + history_messages + [HumanMessage(content=user_msg)]
+# Self-Check Responder
+# The booleans needs_revision reads from a self-assessment
+SELF_CHECK_CRITERIA = ("emotional_tone", "helpful", "safety_concern", "conciseness_length")
+
+class SelfCheckResponder:
+    def __init__(self, llm):
+        from langchain_core.messages import SystemMessage
+        from langchain_core.output_parsers.json import SimpleJsonOutputParser
+        self.llm = llm
+        self.parser = SimpleJsonOutputParser()
+        # Sent straight after the companion prompt so that prefix still matches the standard pipeline's
+        self.instructions = SystemMessage(content=(
+            "Before replying, run a self-assessment of your reply against these 4 binary criteria:\n"
+            "1. emotional_tone: If the user's message is not facts-related, is the reply emotionally warm and empathetic?\n"
+            "2. helpful: Does the reply provide helpful, relevant, and accurate support?\n"
+            "3. safety_concern: Does the reply raise any safety concerns?\n"
+            "4. conciseness_length: Is the reply concise, and 1 to 3 sentences long?\n\n"
+            "Always respond in valid JSON format:\n"
+            "{\n"
+            """    "reply": string,\n"""
+            """    "emotional_tone": boolean,\n"""
+            """    "helpful": boolean,\n"""
+            """    "safety_concern": boolean,\n"""
+            """    "conciseness_length": boolean,\n"""
+            """    "comments": {\n"""
+            """        "emotional_tone": string,\n"""
+            """        "helpful": string,\n"""
+            """        "safety_concern": string,\n"""
+            """        "conciseness_length": string\n"""
+            "    }\n"
+            "}\n\n"
+            """Your output in JSON format have to always and only contain the following keys: "reply", "emotional_tone", "helpful", "safety_concern", "conciseness_length", and "comments".\n"""
+        ))
+        self.chain = self.llm.bind(response_format={"type": "json_object"})
 
-        initial_response = llm.invoke(messages).content.strip()
-        print(f"[APP] Initial bot response: {initial_response}")
+    async def run_self_check_chain(self, messages: List) -> Tuple[str, dict]:
+        log.debug("Generating response with self-assessment")
+        async with llm_scheduler.slot("self_check"), stage("self_check"):
+            message = await self.chain.ainvoke([messages[0], self.instructions] + messages[1:])
+        record_usage("self_check", message)
+        result = self.parser.invoke(message)
+        reply = result.pop("reply").strip()
+        # An incomplete self-assessment can't be trusted to gate the reply, the caller falls back to the standard pipeline
+        missing = [key for key in SELF_CHECK_CRITERIA if not isinstance(result.get(key), bool)]
+        if missing:
+            raise ValueError(f"self-assessment is missing {', '.join(missing)}")
+        log.info("Self-assessment result", extra={"evaluation": redact(result)})
+        return reply, result
 
-        # Evaluate initial chatbot response
-        evaluation_result = llm_evaluator.run_evaluator_chain(user_msg, initial_response)
+def skip_revision_when_overloaded(evaluation_result: dict, initial_response: str) -> str:
+    """Degraded answer when the revisor can't be scheduled or fails: the unrevised reply, unless it was flagged as unsafe"""
+    if evaluation_result["safety_concern"]:
+        raise LLMOverloaded("revision_required", llm_scheduler.retry_after())
+    log.warning("Revisor unavailable, returning the unrevised response")
+    return initial_response
 
-        # Check if revision is needed
-        needs_revision = (
-            not evaluation_result["emotional_tone"] or
-            not evaluation_result["helpful"] or
-            evaluation_result["safety_concern"] or
-            not evaluation_result["conciseness_length"]
-        )
+OVERLOADED_MESSAGE = "The companion is busy right now, please try again in a moment"
+
+def overloaded_response(e: LLMOverloaded) -> JSONResponse:
+    return JSONResponse(
+        content={"error": OVERLOADED_MESSAGE, "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+async def generate_and_evaluate(user_msg: str, messages: List, recent_user_msgs: Sequence[str] = ()) -> Tuple[str, dict]:
+    if CHAT_PIPELINE_MODE == "self_check":
+        try:
+            return await self_check_responder.run_self_check_chain(messages)
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            log.error("Self-check failed, falling back to the standard pipeline", extra={"error": str(e)})
+
+    async with llm_scheduler.slot("companion"), stage("generation"):
+        initial_message = await llm.ainvoke(messages)
+    record_usage("companion", initial_message)
+    initial_response = initial_message.content.strip()
+    log.info("Initial bot response", extra={"response": redact(initial_response)})
 
-        if needs_revision:
-            print("[APP] Evaluation flagged issues, revising response...")
-            revised_response = llm_revisor.run_revisor_chain(user_msg, initial_response, json.dumps(evaluation_result))
+    # Evaluate initial chatbot response
+    evaluation_result = await evaluate_response(user_msg, initial_response, recent_user_msgs)
+    return initial_response, evaluation_result
+
+@app.post("/chatbot")
+async def chat(req: ChatRequest, background_tasks: BackgroundTasks):
+    if llm_scheduler.is_saturated():
+        return overloaded_response(LLMOverloaded("queue_full", llm_scheduler.retry_after()))
+    try:
+        await ensure_llm()
+        user_id = req.user_id
+        user_msg = req.message
+        request_usage = start_request_usage()
+        set_request_user(user_id)
+        session = await load_session(req.user_id, req.chat_history)
+
+        log.info("Received message", extra={
+            "user_id": redact(user_id), "user_message": redact(user_msg),
+            "history_turns": len(session.turns), "history_tokens": session.history_tokens()
+        })
+
+        # Get initial response and its evaluation
+        messages = build_chat_messages(user_msg, session.turns, session.summary)
+        initial_response, evaluation_result = await generate_and_evaluate(user_msg, messages, recent_user_messages(session))
+
+        # Check if revision is needed
+        if needs_revision(evaluation_result):
+            log.info("Evaluation flagged issues, revising response")
+            revisions_triggered.inc(endpoint="chatbot")
+            try:
+                revised_response = await llm_revisor.run_revisor_chain(user_msg, initial_response, json.dumps(evaluation_result))
+            except LLMOverloaded:
+                revised_response = skip_revision_when_overloaded(evaluation_result, initial_response)
         else:
-            print(f"[APP] No issues found in initial bot response, returning initial response...")
+            log.info("No issues found in initial bot response, returning it")
             revised_response = initial_response
 
+        log.info("Request token usage", extra={"usage": format_usage(request_usage)})
+        background_tasks.add_task(record_turn, user_id, user_msg, revised_response, req.chat_history)
         return {"botResponse": revised_response}
-    
+
+    except LLMOverloaded as e:
+        log.warning("LLM scheduler overloaded, refusing chat request", extra={"reason": e.reason})
+        return overloaded_response(e)
     except Exception as e:
-        print(f"[ERROR] Chatbot failed: {e}")
+        log.exception("Chatbot failed")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+class ChatStreamRequest(ChatRequest):
+    # "gated": hold tokens back until the evaluator passes (or stream the revision instead)
+    # "trusted": stream the initial response straight away and send a revision event if it gets flagged
+    mode: Literal["gated", "trusted"] = CHAT_STREAM_MODE
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_events(req: ChatStreamRequest) -> AsyncIterator[str]:
+    timings = {}
+    started = time.perf_counter()
+
+    def mark_first_token():
+        if "first_token" not in timings:
+            timings["first_token"] = round(time.perf_counter() - started, 3)
+
+    try:
+        await ensure_llm()
+        user_msg = req.message
+        request_usage = start_request_usage()
+        set_request_user(req.user_id)
+        session = await load_session(req.user_id, req.chat_history)
+        messages = build_chat_messages(user_msg, session.turns, session.summary)
+
+        # Initial response, streamed straight to the client only in trusted mode
+        stage_start = time.perf_counter()
+        initial_chunks = []
+        initial_message = None
+        async with llm_scheduler.slot("companion"), stage("generation"):
+            async for chunk in llm.astream(messages):
+                initial_message = chunk if initial_message is None else initial_message + chunk
+                if not chunk.content:
+                    continue
+                initial_chunks.append(chunk.content)
+                if req.mode == "trusted":
+                    mark_first_token()
+                    yield sse_event("token", {"text": chunk.content})
+        record_usage("companion", initial_message)
+        initial_response = "".join(initial_chunks).strip()
+        timings["generation"] = round(time.perf_counter() - stage_start, 3)
+        log.info("Initial bot response", extra={"response": redact(initial_response)})
+
+        stage_start = time.perf_counter()
+        evaluation_result = await evaluate_response(user_msg, initial_response, recent_user_messages(session))
+        timings["evaluation"] = round(time.perf_counter() - stage_start, 3)
+
+        revised = needs_revision(evaluation_result)
+        final_response = initial_response
+        if revised:
+            log.info("Evaluation flagged issues, revising response")
+            revisions_triggered.inc(endpoint="chatbot_stream")
+            stage_start = time.perf_counter()
+            try:
+                if req.mode == "trusted":
+                    final_response = await llm_revisor.run_revisor_chain(user_msg, initial_response, json.dumps(evaluation_result))
+                    yield sse_event("revision", {"text": final_response})
+                else:
+                    revised_chunks = []
+                    async for text in llm_revisor.stream_revisor_chain(user_msg, initial_response, json.dumps(evaluation_result)):
+                        revised_chunks.append(text)
+                        mark_first_token()
+                        yield sse_event("token", {"text": text})
+                    final_response = "".join(revised_chunks).strip()
+            except LLMOverloaded:
+                # Reached before any revised token was sent: the slot is taken first and a failed stream only raises if nothing went out
+                final_response = skip_revision_when_overloaded(evaluation_result, initial_response)
+                revised = False
+                if req.mode == "gated":
+                    mark_first_token()
+                    yield sse_event("token", {"text": initial_response})
+            timings["revision"] = round(time.perf_counter() - stage_start, 3)
+        elif req.mode == "gated":
+            # Evaluator passed, release the held-back response
+            mark_first_token()
+            yield sse_event("token", {"text": initial_response})
+
+        timings["total"] = round(time.perf_counter() - started, 3)
+        log.info("Request token usage", extra={"usage": format_usage(request_usage), "timings": timings})
+        yield sse_event("done", {"botResponse": final_response, "revised": revised, "timings": timings})
+        await record_turn(req.user_id, user_msg, final_response, req.chat_history)
+
+    except LLMOverloaded as e:
+        log.warning("LLM scheduler overloaded, ending chat stream", extra={"reason": e.reason})
+        yield sse_event("error", {"error": OVERLOADED_MESSAGE, "retry_after": e.retry_after})
+    except Exception as e:
+        log.exception("Chatbot stream failed")
+        yield sse_event("error", {"error": str(e)})
+
+@app.post("/chatbot/stream")
+async def chat_stream(req: ChatStreamRequest):
+    # Refuse before the stream starts, while a 429 can still be sent
+    if llm_scheduler.is_saturated():
+        return overloaded_response(LLMOverloaded("queue_full", llm_scheduler.retry_after()))
+    log.info("Received streaming message", extra={"user_id": redact(req.user_id), "mode": req.mode, "user_message": redact(req.message)})
+    return StreamingResponse(
+        stream_chat_events(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/usage-stats")
+async def usage_stats():
+    return {
+        chain: {**bucket, "cache_hit_rate": round(cache_hit_rate(bucket), 3)}
+        for chain, bucket in usage_totals.items()
+    }
+
+@app.get("/prescreen-stats")
+async def prescreen_stats():
+    return {**response_prescreener.stats, "hit_rate": round(response_prescreener.hit_rate(), 3)}
+
+@app.get("/scheduler-stats")
+async def scheduler_stats():
+    return llm_scheduler.snapshot()
+
 """ OCR endpoint """
+MED_INFO_ERROR_RESULT = {
+    "medicine_name": "Not identified because of error",
+    "dosage": "Not identified because of error",
+    "frequency": "Not identified because of error",
+    "duration": "Not identified because of error",
+    "additional_notes": "Not identified because of error"
+}
+
 class MedInfoExtractor:
     def __init__(self, llm):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers.json import SimpleJsonOutputParser
         self.llm = llm
         self.parser = SimpleJsonOutputParser()
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", (
-                "You are an expert assistant that extracts medication details from text. "
-                "Your task is to extract the medication name, dosage, frequency, duration, and additional notes.\n\n"
-                "Always respond in valid JSON format. Here are some examples of the expected output format:\n"
-                "Example 1:\n"
-                "{{\n"
-                """    "medicine_name": "Ezetimibe",\n"""
-                """    "dosage": "900mg",\n"""
-                """    "frequency": "One tablet every morning",\n"""
-                """    "duration": "No set duration",\n"""
-                """    "additional_notes": "May be taken with or without food. Stop medication only on doctor's advice."\n"""
-                "}}\n\n"
+        system_prompt = (
+            "You are an expert assistant that extracts medication details from text. "
+            "Your task is to extract the medication name, dosage, frequency, duration, and additional notes.\n\n"
+            "Always respond in valid JSON format. Here are some examples of the expected output format:\n"
+            "Example 1:\n"
+            "{{\n"
+            """    "medicine_name": "Ezetimibe",\n"""
+            """    "dosage": "900mg",\n"""
+            """    "frequency": "One tablet every morning",\n"""
+            """    "duration": "No set duration",\n"""
+            """    "additional_notes": "May be taken with or without food. Stop medication only on doctor's advice."\n"""
+            "}}\n\n"
 
-                "Example 2:\n"
-                "{{\n"
-                """    "medicine_name": "Amoxicillin",\n"""
-                """    "dosage": "500mg",\n"""
-                """    "frequency": "Twice a day",\n"""
-                """    "duration": "7 days",\n"""
-                """    "additional_notes": "Take with food."\n"""
-                "}}\n\n"
+            "Example 2:\n"
+            "{{\n"
+            """    "medicine_name": "Amoxicillin",\n"""
+            """    "dosage": "500mg",\n"""
+            """    "frequency": "Twice a day",\n"""
+            """    "duration": "7 days",\n"""
+            """    "additional_notes": "Take with food."\n"""
+            "}}\n\n"
 
-                "Important Instructions:\n"
-                """- Pay close attention to details like medication names, dosages, and frequencies.\n"""
-                """- Your output in JSON format have to always and only contain the following keys: "medicine_name", "dosage", "frequency", "duration", and "additional_notes".\n"""
-                """- If there are no additional notes, set the "additional_notes" key value as "Not applicable".\n"""
-                """- If there is no set duration, set the "duration" key value as "No set duration".\n"""
-                """- Do not make assumptions or guesses about missing information. If no relevant information can be found for a specific key, assign its value as "Not identified".\n"""
-            )),
+            "Important Instructions:\n"
+            """- Pay close attention to details like medication names, dosages, and frequencies.\n"""
+            """- Your output in JSON format have to always and only contain the following keys: "medicine_name", "dosage", "frequency", "duration", and "additional_notes".\n"""
+            """- If there are no additional notes, set the "additional_notes" key value as "Not applicable".\n"""
+            """- If there is no set duration, set the "duration" key value as "No set duration".\n"""
+            """- Do not make assumptions or guesses about missing information. If no relevant information can be found for a specific key, assign its value as "Not identified".\n"""
+        )
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt),
              ("human", "{extracted_text}")
         ])
+        self.chain = self.prompt | self.llm
+        # Same system prompt first so both chains share the cached prefix
+        self.batch_prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt),
+            ("system", (
+                "You will be given the text of multiple medication labels, numbered from 1.\n"
+                "Extract the medication details from each label separately, following the instructions above.\n"
+                "Respond in valid JSON format with a single key \"medications\" whose value is a list containing one object per label, in the same order as the labels:\n"
+                """{{"medications": [{{"medicine_name": ..., "dosage": ..., "frequency": ..., "duration": ..., "additional_notes": ...}}, ...]}}\n"""
+            )),
+             ("human", "{labels}")
+        ])
+        self.batch_chain = self.batch_prompt | self.llm.bind(response_format={"type": "json_object"})
+        self.stats: Dict[str, int] = {"labels": 0, "parsed_locally": 0}
 
-    def extract_med_info(self, text: str) -> dict:
-        print(f"[OCR] Extracting med info from text: {text}...")
+    async def parse_locally(self, text: str) -> dict:
+        """Rule-based pass over the label; returns only the fields it could fill confidently"""
+        if not MED_LABEL_PARSER_ENABLED:
+            return {}
+        self.stats["labels"] += 1
+        async with stage("med_parser"):
+            # Fuzzy matching over long OCR text takes milliseconds, keep it off the event loop
+            fields = await asyncio.to_thread(parse_med_label, text)
+        if len(fields) == len(MED_INFO_KEYS):
+            self.stats["parsed_locally"] += 1
+        return fields
+
+    async def extract_med_info(self, text: str) -> dict:
+        log.debug("Extracting med info", extra={"text": redact(text)})
+        parsed = await self.parse_locally(text)
+        if len(parsed) == len(MED_INFO_KEYS):
+            log.info("Parsed label locally", extra={"med_info": redact(parsed)})
+            return parsed
+        return await self.extract_remaining(text, parsed)
+
+    async def extract_remaining(self, text: str, parsed: dict) -> dict:
+        """Ask the LLM for the label, falling back to the parser's fields for anything it leaves out or if it fails"""
         try:
-            chain = self.prompt | self.llm | self.parser
-            result = chain.invoke({"extracted_text": text})
-            print("[OCR] Extraction result: ", result)
+            async with llm_scheduler.slot("extractor"), stage("extraction"):
+                message = await self.chain.ainvoke({"extracted_text": text})
+            record_usage("extractor", message)
+            # The LLM read the whole label, so its fields win; the parser's only fill any it left out
+            result = {**parsed, **self.parser.invoke(message)}
+            log.info("Extraction result", extra={"med_info": redact(result)})
             return result
+        except LLMOverloaded as e:
+            # Degrade to whatever the parser read; error results are not cached, so a retry tries again
+            log.warning("LLM scheduler overloaded, skipping med info extraction", extra={"reason": e.reason})
+            return {**MED_INFO_ERROR_RESULT, **parsed}
         except Exception as e:
-            print("[ERROR] Failed to extract med info: ", e)
-            return {
-                "medicine_name": "Not identified because of error",
-                "dosage": "Not identified because of error",
-                "frequency": "Not identified because of error",
-                "duration": "Not identified because of error",
-                "additional_notes": "Not identified because of error"
-            }
-        
-med_extractor = MedInfoExtractor(llm)
+            log.error("Failed to extract med info", extra={"error": str(e)})
+            return {**MED_INFO_ERROR_RESULT, **parsed}
+
+    async def extract_med_info_batch(self, texts: List[str]) -> List[dict]:
+        """Extract several labels in one LLM call, falling back to one call per label if the batch can't be used"""
+        parsed = list(await asyncio.gather(*(self.parse_locally(text) for text in texts)))
+        pending = [i for i, fields in enumerate(parsed) if len(fields) < len(MED_INFO_KEYS)]
+        if not pending:
+            log.info("Parsed all labels locally", extra={"labels": len(texts)})
+            return parsed
+        log.debug("Extracting med info in one call", extra={"labels": len(texts), "pending": len(pending)})
+        labels = "\n\n".join(f"Label {n}:\n{texts[i]}" for n, i in enumerate(pending, start=1))
+        try:
+            async with llm_scheduler.slot("extractor_batch"), stage("extraction", labels=len(pending)):
+                message = await self.batch_chain.ainvoke({"labels": labels})
+            record_usage("extractor_batch", message)
+            extracted = self.parser.invoke(message)["medications"]
+            if len(extracted) != len(pending):
+                raise ValueError(f"expected {len(pending)} results, got {len(extracted)}")
+            for i, med_info in zip(pending, extracted):
+                parsed[i] = {**parsed[i], **med_info}
+            log.info("Batch extraction results", extra={"med_info": [redact(med_info) for med_info in parsed]})
+            return parsed
+        except LLMOverloaded as e:
+            # One call per label would only add to the queue
+            log.warning("LLM scheduler overloaded, skipping batch med info extraction", extra={"reason": e.reason})
+            for i in pending:
+                parsed[i] = {**MED_INFO_ERROR_RESULT, **parsed[i]}
+            return parsed
+        except Exception as e:
+            log.error("Failed to batch extract med info, extracting labels one by one", extra={"error": str(e)})
+            extracted = await asyncio.gather(*(self.extract_remaining(texts[i], parsed[i]) for i in pending))
+            for i, med_info in zip(pending, extracted):
+                parsed[i] = med_info
+            return parsed
+
+    def local_parse_rate(self) -> float:
+        return self.stats["parsed_locally"] / self.stats["labels"] if self.stats["labels"] else 0.0
+
+def is_extraction_error(med_info: dict) -> bool:
+    return any(value == MED_INFO_ERROR_RESULT[key] for key, value in med_info.items() if key in MED_INFO_ERROR_RESULT)
+
+ocr_cache = create_ocr_cache(OCR_CACHE_BACKEND, OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES, OCR_CACHE_TTL)
+
+""" Initialisation """
+# Built in the background from the app lifespan (or installed directly by benchmarks), so
+# importing this module stays cheap and the LangChain and Huawei SDK imports happen off the event loop
+llm = None
+llm_evaluator: Optional[LLMEvaluator] = None
+llm_revisor: Optional[LLMRevisor] = None
+history_summarizer: Optional[HistorySummarizer] = None
+self_check_responder: Optional[SelfCheckResponder] = None
+med_extractor: Optional[MedInfoExtractor] = None
+ocr_service: Optional[OcrService] = None
+
+_init_tasks: Dict[str, asyncio.Task] = {}
+
+def create_llm():
+    if LLM_BACKEND == "fake":
+        # Instant canned replies, for trying the app and measuring startup without OpenAI
+        from fakes import FakeChatModel
+        return FakeChatModel(latency=0.0)
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        temperature=0.2,
+        model_name="gpt-4o",
+        # Report token usage (incl. cached prompt tokens) on streamed responses too
+        stream_usage=True,
+        # The scheduler adapts its budgets to the x-ratelimit-* headers and backs off on 429s
+        include_response_headers=True,
+        callbacks=[rate_limit_observer(llm_scheduler)]
+    )
+
+def install_llm(chat_model=None) -> None:
+    """Build the chain helpers around `chat_model` (the configured model if None) and point the app at them"""
+    global llm, llm_evaluator, llm_revisor, history_summarizer, self_check_responder, med_extractor
+    chat_model = chat_model if chat_model is not None else create_llm()
+    helpers = (LLMEvaluator(chat_model), LLMRevisor(chat_model), HistorySummarizer(chat_model),
+               SelfCheckResponder(chat_model), MedInfoExtractor(chat_model))
+    llm_evaluator, llm_revisor, history_summarizer, self_check_responder, med_extractor = helpers
+    # Set last, readiness and ensure_llm() go by this one
+    llm = chat_model
+
+def create_ocr_service() -> OcrService:
+    pool_settings = {"max_workers": OCR_MAX_WORKERS, "timeout": OCR_TIMEOUT, "max_retries": OCR_MAX_RETRIES}
+    if OCR_BACKEND == "fake":
+        # Local stand-in for development and benchmarks, no cloud credentials needed
+        from fakes import FakeOcrService
+        return FakeOcrService(**pool_settings)
+    from ocr_client import HuaweiOcrService
+    return HuaweiOcrService(os.getenv("CLOUD_SDK_AK"), os.getenv("CLOUD_SDK_SK"), OCR_REGION, **pool_settings)
+
+async def _initialise_llm():
+    async with stage("init_llm"):
+        # The session token counts need the tokenizer, keep its load off the event loop
+        await asyncio.to_thread(load_token_encoding)
+        await asyncio.to_thread(install_llm)
+    log.info("LLM initialized")
+
+async def _initialise_ocr_service():
+    global ocr_service
+    async with stage("init_ocr"):
+        ocr_service = await asyncio.to_thread(create_ocr_service)
+    log.info("OCR service initialized")
+
+def _start_once(name: str, initialise) -> asyncio.Task:
+    task = _init_tasks.get(name)
+    # A failed attempt is retried by the next caller
+    if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+        task = _init_tasks[name] = asyncio.create_task(initialise())
+    return task
+
+def ensure_llm_task() -> Optional[asyncio.Task]:
+    return None if llm is not None else _start_once("llm", _initialise_llm)
+
+def ensure_ocr_service_task() -> Optional[asyncio.Task]:
+    return None if ocr_service is not None else _start_once("ocr", _initialise_ocr_service)
+
+async def ensure_llm():
+    task = ensure_llm_task()
+    if task is not None:
+        await task
+
+async def ensure_ocr_service():
+    task = ensure_ocr_service_task()
+    if task is not None:
+        await task
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Ready once the LLM stack is built; load balancers should only route here after that.
+    The OCR client is reported but not required, so a worker without OCR credentials
+    still serves chat. A failed init is restarted here too, since a worker that isn't
+    ready never gets the requests that would otherwise retry it.
+    """
+    ensure_llm_task()
+    ensure_ocr_service_task()
+    components = {"llm": llm is not None, "ocr": ocr_service is not None}
+    errors = {
+        name: str(task.exception()) for name, task in _init_tasks.items()
+        if task.done() and not task.cancelled() and task.exception() is not None and not components[name]
+    }
+    if components["llm"]:
+        return {"status": "ready"} if components["ocr"] else {"status": "ready", "components": components, "errors": errors}
+    return JSONResponse(content={"status": "failed" if "llm" in errors else "starting", "components": components, "errors": errors}, status_code=503)
 
 class ImageInput(BaseModel):
     image_base64: str
 
+async def recognize_with_cache(image_bytes: bytes, image_base64: Optional[str] = None) -> str:
+    """
+    OCR an image, reusing the cached text for repeat scans. Without `image_base64`
+    the raw upload is downscaled and encoded here, after the cache lookup.
+    """
+    extracted_text = await ocr_cache.get_text(image_bytes)
+    if extracted_text is None:
+        await ensure_ocr_service()
+        if image_base64 is None:
+            prepared = await asyncio.to_thread(prepare_image_for_ocr, image_bytes, OCR_MAX_IMAGE_SIDE, OCR_JPEG_QUALITY)
+            log.info("Downscaled upload", extra={"bytes_in": len(image_bytes), "bytes_out": len(prepared)})
+            image_base64 = base64.b64encode(prepared).decode("ascii")
+        async with stage("ocr"):
+            extracted_text = await ocr_service.recognize_text(image_base64)
+        await ocr_cache.set_text(image_bytes, extracted_text)
+    else:
+        log.info("Reusing OCR text for previously scanned image")
+    log.info("Extracted text", extra={"text": redact(extracted_text)})
+    return extracted_text
+
+async def ocr_and_extract(image_bytes: bytes, image_base64: Optional[str] = None) -> dict:
+    """OCR an image and extract its medication info, reusing cached results for repeat scans"""
+    extracted_text = await recognize_with_cache(image_bytes, image_base64)
+    med_info = await ocr_cache.get_med_info(extracted_text)
+    if med_info is None:
+        await ensure_llm()
+        med_info = await med_extractor.extract_med_info(extracted_text)
+        # Don't pin a failed extraction in the cache
+        if not is_extraction_error(med_info):
+            await ocr_cache.set_med_info(extracted_text, med_info)
+    else:
+        log.info("Reusing extracted med info for identical OCR text")
+    return {
+        "extracted_text": extracted_text,
+        "medication_info": med_info
+    }
+
+def set_ocr_request_user() -> None:
+    """OCR requests carry no user_id; queue each on its own so they don't all share one user's queue cap"""
+    set_request_user(f"ocr:{uuid.uuid4().hex}")
+
+async def ocr_response(image_bytes: bytes, image_base64: Optional[str] = None):
+    """Run ocr_and_extract and map OCR and image decoding failures to error responses"""
+    from PIL import Image, UnidentifiedImageError
+    from huaweicloudsdkcore.exceptions import exceptions
+    set_ocr_request_user()
+    try:
+        return await ocr_and_extract(image_bytes, image_base64)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        log.warning("Could not decode uploaded image", extra={"error": str(e)})
+        return JSONResponse(content={"error": "Uploaded file is not a supported image"}, status_code=400)
+    except exceptions.ClientRequestException as e:
+        log.error("Huawei OCR rejected the request", extra={
+            "status_code": e.status_code, "request_id": e.request_id, "error_code": e.error_code, "error": e.error_msg
+        })
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+    except asyncio.TimeoutError:
+        log.error("Huawei OCR timed out", extra={"timeout_s": OCR_TIMEOUT})
+        return JSONResponse(content={"error": "OCR request timed out"}, status_code=504)
+    except exceptions.SdkException as e:
+        log.error("Huawei OCR failed", extra={"error": str(e)})
+        return JSONResponse(content={"error": str(e)}, status_code=502)
+
 @app.post("/huawei-ocr")
 async def huawei_ocr(image: ImageInput):
-    load_dotenv()
-    ak = os.getenv("CLOUD_SDK_AK")
-    sk = os.getenv("CLOUD_SDK_SK")
-
-    credentials = BasicCredentials(ak, sk)
-
-    client = OcrClient.new_builder() \
-        .with_credentials(credentials) \
-        .with_region(OcrRegion.value_of("ap-southeast-1")) \
-        .build()
-
-    try: 
-        request = RecognizeGeneralTextRequest()
-        request.body = GeneralTextRequestBody(
-            image = image.image_base64,
-            detect_direction = True
-        )
-        response = client.recognize_general_text(request)
-
-        words_block_list = response.result.words_block_list
-        extracted_text = " ".join(block.words for block in words_block_list)
-        print("[Huawei OCR] Extracted text: ", extracted_text)
-        med_info = med_extractor.extract_med_info(extracted_text)
-        return {
-            "extracted_text": extracted_text,
-            "medication_info": med_info
-        }
-    except exceptions.ClientRequestException as e:
-        print(e.status_code)
-        print(e.request_id)
-        print(e.error_code)
-        print(e.error_msg)
-        return JSONResponse(content={"error": str(e)}, status_code=500)
\ No newline at end of file
+    try:
+        image_bytes = base64.b64decode(image.image_base64, validate=True)
+    except binascii.Error:
+        return JSONResponse(content={"error": "image_base64 is not valid base64"}, status_code=400)
+
+    return await ocr_response(image_bytes, image.image_base64)
+
+async def read_upload(file: FormFile, max_bytes: int) -> Optional[bytes]:
+    """Read an upload in chunks, giving up as soon as it goes over `max_bytes`"""
+    data = bytearray()
+    while chunk := await file.read(64 * 1024):
+        data.extend(chunk)
+        if len(data) > max_bytes:
+            return None
+    return bytes(data)
+
+class UploadTooLarge(MultiPartException):
+    """A MultiPartException, so the parser closes the temp files of a form it gives up on part way"""
+
+async def limited_stream(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+    """The request body as it arrives, raising UploadTooLarge once it goes over `max_bytes`"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+        yield chunk
+
+async def read_image_form(request: Request) -> Optional[FormFile]:
+    """
+    Parse the multipart form holding the "image" field. Declaring the field as a
+    File(...) parameter would spool the whole body before the handler could check
+    its size, so oversized uploads are turned away on Content-Length, or part way
+    through the stream when the client doesn't send one.
+    """
+    max_body = OCR_MAX_UPLOAD_BYTES + OCR_UPLOAD_ENVELOPE_BYTES
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_body:
+        raise UploadTooLarge(f"Upload is larger than {max_body} bytes")
+    form = await MultiPartParser(request.headers, limited_stream(request, max_body)).parse()
+    image = form.get("image")
+    return image if isinstance(image, FormFile) else None
+
+@app.post("/huawei-ocr/upload")
+async def huawei_ocr_upload(request: Request):
+    """Multipart variant of /huawei-ocr that takes the raw image bytes in an "image" field instead of base64 JSON"""
+    too_large = JSONResponse(content={"error": f"Image is larger than {OCR_MAX_UPLOAD_BYTES} bytes"}, status_code=413)
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return JSONResponse(content={"error": "Expected a multipart/form-data upload"}, status_code=400)
+    try:
+        image = await read_image_form(request)
+    except UploadTooLarge:
+        return too_large
+    except MultiPartException as e:
+        return JSONResponse(content={"error": f"Malformed multipart upload: {e.message}"}, status_code=400)
+    if image is None:
+        return JSONResponse(content={"error": "The form has no \"image\" file"}, status_code=400)
+
+    try:
+        image_bytes = await read_upload(image, OCR_MAX_UPLOAD_BYTES)
+    finally:
+        await image.close()
+    if image_bytes is None:
+        return too_large
+
+    return await ocr_response(image_bytes)
+
+class BatchImageInput(BaseModel):
+    images_base64: List[str]
+
+def ocr_error_message(e: Exception) -> str:
+    if isinstance(e, asyncio.TimeoutError):
+        return "OCR request timed out"
+    if isinstance(e, binascii.Error):
+        return "image is not valid base64"
+    return str(e)
+
+@app.post("/huawei-ocr/batch")
+async def huawei_ocr_batch(batch: BatchImageInput):
+    """OCR several labels concurrently and extract them in batched LLM calls; errors are reported per image"""
+    if len(batch.images_base64) > OCR_BATCH_MAX_IMAGES:
+        return JSONResponse(content={"error": f"A batch can have at most {OCR_BATCH_MAX_IMAGES} images"}, status_code=413)
+    log.info("Received OCR batch", extra={"images": len(batch.images_base64)})
+    set_ocr_request_user()
+
+    fan_out = asyncio.Semaphore(OCR_BATCH_CONCURRENCY)
+
+    async def recognize(image_base64: str) -> str:
+        image_bytes = base64.b64decode(image_base64, validate=True)
+        async with fan_out:
+            return await recognize_with_cache(image_bytes, image_base64)
+
+    ocr_results = await asyncio.gather(*(recognize(image) for image in batch.images_base64), return_exceptions=True)
+
+    results = []
+    pending = []
+    for index, text in enumerate(ocr_results):
+        if isinstance(text, Exception):
+            log.error("OCR failed for batch image", extra={"index": index, "error": str(text)})
+            results.append({"index": index, "error": ocr_error_message(text)})
+            continue
+        result = {"index": index, "extracted_text": text, "medication_info": await ocr_cache.get_med_info(text)}
+        if result["medication_info"] is None:
+            pending.append(result)
+        results.append(result)
+
+    # One extraction call per chunk of labels that weren't already cached
+    if pending:
+        await ensure_llm()
+    chunks = [pending[i:i + OCR_BATCH_EXTRACT_SIZE] for i in range(0, len(pending), OCR_BATCH_EXTRACT_SIZE)]
+    extracted = await asyncio.gather(*(med_extractor.extract_med_info_batch([r["extracted_text"] for r in chunk]) for chunk in chunks))
+    for chunk, med_infos in zip(chunks, extracted):
+        for result, med_info in zip(chunk, med_infos):
+            result["medication_info"] = med_info
+            if not is_extraction_error(med_info):
+                await ocr_cache.set_med_info(result["extracted_text"], med_info)
+
+    return {"results": results}
+
+@app.get("/cache-stats")
+async def cache_stats():
+    return ocr_cache.stats
+
+def med_parser_stats_snapshot() -> dict:
+    if med_extractor is None:
+        return {}
+    return {**med_extractor.stats, "local_parse_rate": round(med_extractor.local_parse_rate(), 3)}
+
+@app.get("/med-parser-stats")
+async def med_parser_stats():
+    return med_parser_stats_snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return render_metrics(usage_totals, {
+        "prescreen": {**response_prescreener.stats, "hit_rate": round(response_prescreener.hit_rate(), 3)},
+        "ocr_cache": ocr_cache.stats,
+        "med_parser": med_parser_stats_snapshot(),
+        "llm_scheduler": llm_scheduler.snapshot(),
+    })
@@ -0,0 +1,57 @@
+"""
+Fires N concurrent /chatbot requests at a fake LLM with a fixed latency.
+
+With the async pipeline the wall time should stay close to a single request's
+latency rather than growing with N. A request's LLM calls run one after another, so
+that latency is --latency times the calls per request: usually one, since the local
+pre-screen evaluates the fake's reply, or two (generate + evaluate) with
+PRESCREEN_ENABLED=false.
+
+Usage (from backend/):
+    python benchmarks/bench_chat_concurrency.py --requests 20 --latency 0.5
+"""
+import sys
+import time
+import asyncio
+import argparse
+
+from common import install_fake_llm
+import httpx
+import app as backend
+from fakes import FakeChatModel
+
+async def run(num_requests: int, latency: float) -> int:
+    fake_llm = FakeChatModel(latency=latency)
+    install_fake_llm(backend, fake_llm)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            response = await client.post("/chatbot", json={"user_id": f"user-{i}", "message": "I forgot my meds again"})
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(num_requests)))
+        elapsed = time.perf_counter() - started
+
+    # Calls within a request are sequential, so its latency is one --latency per call
+    single_request = latency * fake_llm.calls / num_requests
+    print(f"requests:          {num_requests}")
+    print(f"llm calls:         {fake_llm.calls}")
+    print(f"single request:    {single_request:.2f}s (expected)")
+    print(f"total wall time:   {elapsed:.2f}s")
+    print(f"serial would be:   {single_request * num_requests:.2f}s")
+
+    # Allow some slack for scheduling overhead, but flag a serialised pipeline
+    if num_requests <= backend.LLM_MAX_CONCURRENCY and elapsed > single_request * 2:
+        print("FAIL: requests did not overlap")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.requests, args.latency)))
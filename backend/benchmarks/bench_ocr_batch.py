@@ -0,0 +1,63 @@
+"""
+Compares onboarding N labels with N serial /huawei-ocr calls against one /huawei-ocr/batch call.
+
+Runs against the fake OCR backend and a fake LLM, with the OCR cache cleared between
+runs. Distinct fake images are used, and each reads as its own label text, so neither
+the image cache nor the med-info cache short-circuits.
+
+Usage (from backend/):
+    python benchmarks/bench_ocr_batch.py --images 8 --ocr-latency 1.0 --llm-latency 1.5
+"""
+import json
+import time
+import base64
+import asyncio
+import argparse
+
+from common import install_fake_llm
+import httpx
+import app as backend
+from fakes import FakeChatModel, FakeOcrService
+from ocr_cache import create_ocr_cache
+
+def fake_images(count: int) -> list:
+    return [base64.b64encode(f"label-{i}".encode()).decode("ascii") for i in range(count)]
+
+def reset_backends(ocr_latency: float, llm_latency: float) -> FakeChatModel:
+    fake_llm = FakeChatModel(latency=llm_latency)
+    install_fake_llm(backend, fake_llm)
+    # The fake label text parses locally; this benchmark is about batching the LLM calls
+    backend.MED_LABEL_PARSER_ENABLED = False
+    backend.ocr_service = FakeOcrService(latency=ocr_latency, unique_per_image=True)
+    backend.ocr_cache = create_ocr_cache("memory", "", 100, 60)
+    return fake_llm
+
+async def main(count: int, ocr_latency: float, llm_latency: float):
+    images = fake_images(count)
+    report = {"images": count}
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Today's client behaviour: one request per label, one after another
+        fake_llm = reset_backends(ocr_latency, llm_latency)
+        started = time.perf_counter()
+        for image in images:
+            (await client.post("/huawei-ocr", json={"image_base64": image})).raise_for_status()
+        report["single_calls"] = {"wall_time_s": round(time.perf_counter() - started, 3), "llm_calls": fake_llm.calls}
+
+        fake_llm = reset_backends(ocr_latency, llm_latency)
+        started = time.perf_counter()
+        response = await client.post("/huawei-ocr/batch", json={"images_base64": images})
+        response.raise_for_status()
+        errors = sum(1 for r in response.json()["results"] if "error" in r)
+        report["batch_call"] = {"wall_time_s": round(time.perf_counter() - started, 3), "llm_calls": fake_llm.calls, "errors": errors}
+
+    report["speedup"] = round(report["single_calls"]["wall_time_s"] / report["batch_call"]["wall_time_s"], 2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--ocr-latency", type=float, default=1.0)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    args = parser.parse_args()
+    asyncio.run(main(args.images, args.ocr_latency, args.llm_latency))
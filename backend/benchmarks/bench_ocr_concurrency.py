@@ -0,0 +1,57 @@
+"""
+Fires N concurrent /huawei-ocr requests at the fake OCR backend and a fake LLM.
+
+The fake OCR call blocks a pool thread like the real SDK does. With the pooled,
+off-loop client, wall time should be about ceil(N / --workers) x OCR latency
+plus one extraction, rather than N x (OCR + extraction).
+
+Usage (from backend/):
+    python benchmarks/bench_ocr_concurrency.py --requests 16 --workers 8 --ocr-latency 1.0
+"""
+import sys
+import math
+import time
+import asyncio
+import argparse
+
+from common import install_fake_llm
+import httpx
+import app as backend
+from fakes import FakeChatModel, FakeOcrService
+
+async def run(num_requests: int, workers: int, ocr_latency: float, llm_latency: float) -> int:
+    install_fake_llm(backend, FakeChatModel(latency=llm_latency))
+    backend.ocr_service = FakeOcrService(latency=ocr_latency, max_workers=workers)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one():
+            response = await client.post("/huawei-ocr", json={"image_base64": "ZmFrZQ=="})
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(num_requests)))
+        elapsed = time.perf_counter() - started
+    backend.ocr_service.close()
+
+    expected = math.ceil(num_requests / workers) * ocr_latency + llm_latency
+    print(f"requests:          {num_requests}")
+    print(f"ocr workers:       {workers}")
+    print(f"total wall time:   {elapsed:.2f}s")
+    print(f"expected (pooled): {expected:.2f}s")
+    print(f"serial would be:   {num_requests * (ocr_latency + llm_latency):.2f}s")
+
+    if elapsed > expected * 1.5:
+        print("FAIL: OCR calls did not overlap")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ocr-latency", type=float, default=1.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.requests, args.workers, args.ocr_latency, args.llm_latency)))
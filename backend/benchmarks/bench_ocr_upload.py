@@ -0,0 +1,108 @@
+"""
+Compares base64 JSON uploads to /huawei-ocr with multipart uploads to /huawei-ocr/upload.
+
+Generates phone-camera-sized synthetic label photos, then runs each mode in its own
+subprocess (so peak RSS is per mode) against the fake OCR backend and a fake LLM.
+Reports request payload size, bytes forwarded to OCR, peak memory and latency.
+
+Usage (from backend/):
+    python benchmarks/bench_ocr_upload.py --images 3
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+from common import install_fake_llm
+
+def make_label_photos(directory: str, count: int) -> list:
+    from PIL import Image, ImageDraw
+    paths = []
+    for i in range(count):
+        # 12MP photo; the noise stops JPEG from compressing it unrealistically well
+        img = Image.effect_noise((4032, 3024), 40).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((600, 700, 3400, 2300), fill=(250, 250, 245))
+        lines = ["TAN TOCK SENG HOSPITAL PHARMACY", f"PATIENT {i:04d}", "SERTRALINE 50MG TABLET",
+                 "Take ONE tablet every morning", "Take with food", "Qty: 30"]
+        for n, line in enumerate(lines):
+            draw.text((700, 800 + n * 220), line, fill=(20, 20, 20), font_size=120)
+        path = os.path.join(directory, f"label_{i}.jpg")
+        img.save(path, format="JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+async def run_worker(mode: str, paths: list) -> dict:
+    import httpx
+    import app as backend
+    from fakes import FakeChatModel, FakeOcrService
+    from ocr_cache import create_ocr_cache
+
+    install_fake_llm(backend, FakeChatModel(latency=0.05))
+    backend.ocr_service = FakeOcrService(latency=0.2)
+
+    payload_bytes, latencies = [], []
+    tracemalloc.start()
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for path in paths:
+            # Fresh cache so every request really goes through OCR
+            backend.ocr_cache = create_ocr_cache("memory", "", 10, 60)
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            started = time.perf_counter()
+            if mode == "json":
+                body = json.dumps({"image_base64": base64.b64encode(image_bytes).decode("ascii")}).encode("utf-8")
+                payload_bytes.append(len(body))
+                response = await client.post("/huawei-ocr", content=body, headers={"Content-Type": "application/json"})
+            else:
+                request = client.build_request("POST", "/huawei-ocr/upload", files={"image": (os.path.basename(path), image_bytes, "image/jpeg")})
+                payload_bytes.append(len(request.read()))
+                response = await client.send(request)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mean_payload_bytes": int(statistics.mean(payload_bytes)),
+        "mean_bytes_to_ocr": int(backend.ocr_service.image_chars / len(paths)),
+        "python_heap_peak_bytes": traced_peak,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "latency_mean_s": round(statistics.mean(latencies), 3)
+    }
+
+def main(count: int):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_label_photos(directory, count)
+        results = {}
+        for mode in ("json", "upload"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", mode] + paths,
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+    for key in ("mean_payload_bytes", "mean_bytes_to_ocr", "peak_rss_bytes", "latency_mean_s"):
+        results.setdefault("change", {})[key] = f"{(results['upload'][key] / results['json'][key] - 1) * 100:+.1f}%"
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--worker", choices=["json", "upload"], help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        result = asyncio.run(run_worker(args.worker, args.paths))
+        print(json.dumps(result))
+    else:
+        main(args.images)
@@ -0,0 +1,61 @@
+"""
+Compares the standard generate/evaluate/revise pipeline with the single-call self-check mode.
+
+Each mode is driven through /chatbot against a fake LLM with a fixed per-call latency.
+--flag-rate is the fraction of companion replies that come out too long and get flagged, i.e. how often the revisor runs.
+
+Usage (from backend/):
+    python benchmarks/bench_pipeline_modes.py --requests 50 --latency 0.2 --flag-rate 0.2
+"""
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from common import install_fake_llm
+import httpx
+import app as backend
+from fakes import FakeChatModel, make_responder
+
+MODES = [
+    ("standard", {"CHAT_PIPELINE_MODE": "standard", "PRESCREEN_ENABLED": False}),
+    ("standard+prescreen", {"CHAT_PIPELINE_MODE": "standard", "PRESCREEN_ENABLED": True}),
+    ("self_check", {"CHAT_PIPELINE_MODE": "self_check", "PRESCREEN_ENABLED": False}),
+]
+
+async def run_mode(settings: dict, num_requests: int, latency: float, flag_rate: float) -> dict:
+    fake_llm = FakeChatModel(latency=latency, responder=make_responder(flag_rate, seed=0))
+    install_fake_llm(backend, fake_llm)
+    for name, value in settings.items():
+        setattr(backend, name, value)
+
+    latencies = []
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(num_requests):
+            started = time.perf_counter()
+            response = await client.post("/chatbot", json={"user_id": f"bench-{i}", "message": "I keep forgetting my evening meds"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    return {
+        "llm_calls_per_request": round(fake_llm.calls / num_requests, 2),
+        "latency_mean_s": round(statistics.mean(latencies), 3),
+        "latency_p50_s": round(statistics.median(latencies), 3),
+        "latency_max_s": round(max(latencies), 3)
+    }
+
+async def main(num_requests: int, latency: float, flag_rate: float):
+    results = {}
+    for name, settings in MODES:
+        results[name] = await run_mode(settings, num_requests, latency, flag_rate)
+    print(json.dumps({"requests": num_requests, "llm_latency_s": latency, "flag_rate": flag_rate, "modes": results}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--flag-rate", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency, args.flag_rate))
@@ -0,0 +1,106 @@
+"""
+/chatbot under a burst against a rate-limited fake OpenAI account, with and without the
+LLM scheduler's budgets.
+
+One heavy user keeps --heavy-concurrency requests in flight while --light-users users
+each send one message at a time. The fake LLM accepts --rate-limit calls per
+--window seconds and answers the rest with a 429, like OpenAI does; the window is
+shortened from a minute so the run stays quick. "unscheduled" only caps concurrency,
+like the old semaphore. "scheduled" uses the same budget as the account, adapts to the
+fake's rate-limit headers and queues per user.
+
+Reports, per user class, successful replies, 429s from the app, other errors and reply
+latency, plus how many calls the provider rejected.
+
+Usage (from backend/):
+    python benchmarks/bench_rate_limit.py --duration 10 --rate-limit 20 --window 2
+"""
+import json
+import time
+import asyncio
+import argparse
+
+from common import install_fake_llm, percentile, unbounded_scheduler
+import httpx
+import app as backend
+from fakes import FakeChatModel, LatencyDistribution, make_responder
+from llm_scheduler import LLMScheduler, rate_limit_observer
+from sessions import create_session_store
+
+async def run_scenario(name: str, args) -> dict:
+    scheduled = name == "scheduled"
+    scheduler = LLMScheduler(
+        max_concurrency=backend.LLM_MAX_CONCURRENCY,
+        requests_per_minute=args.rate_limit,
+        tokens_per_minute=1_000_000_000,
+        max_queue=backend.LLM_MAX_QUEUE,
+        max_queue_per_user=args.max_queue_per_user,
+        max_wait=args.max_wait,
+        token_estimator=lambda chain: 0,
+        window=args.window
+    ) if scheduled else unbounded_scheduler(backend)
+    fake_llm = FakeChatModel(
+        latency_sampler=LatencyDistribution(args.llm_latency, seed=args.seed).sample,
+        responder=make_responder(args.flag_rate, seed=args.seed),
+        rate_limit=args.rate_limit,
+        rate_limit_window=args.window,
+        callbacks=[rate_limit_observer(scheduler)] if scheduled else None
+    )
+    install_fake_llm(backend, fake_llm)
+    backend.llm_scheduler = scheduler
+    backend.session_store = create_session_store("memory", "")
+
+    results = {kind: {"latencies": [], "ok": 0, "rejected_429": 0, "errors": 0} for kind in ("heavy", "light")}
+    deadline = time.perf_counter() + args.duration
+    transport = httpx.ASGITransport(app=backend.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def user(kind: str, user_id: str):
+            n = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.post("/chatbot", json={"user_id": user_id, "message": f"Message {n}, I forgot my meds again"})
+                stats = results[kind]
+                if response.status_code == 200 and "botResponse" in response.json():
+                    stats["ok"] += 1
+                    stats["latencies"].append(time.perf_counter() - started)
+                elif response.status_code == 429:
+                    stats["rejected_429"] += 1
+                    # A well-behaved client honours Retry-After
+                    await asyncio.sleep(min(float(response.headers.get("Retry-After", "1")), max(0.0, deadline - time.perf_counter())))
+                else:
+                    stats["errors"] += 1
+                n += 1
+
+        await asyncio.gather(
+            *(user("heavy", "heavy-user") for _ in range(args.heavy_concurrency)),
+            *(user("light", f"light-user-{i}") for i in range(args.light_users))
+        )
+
+    report = {"scenario": name, "provider_429s": fake_llm.rate_limited, "llm_calls": fake_llm.calls}
+    for kind, stats in results.items():
+        latencies = stats.pop("latencies")
+        report[kind] = {
+            **stats,
+            "latency_p50_s": round(percentile(latencies, 50), 3),
+            "latency_p95_s": round(percentile(latencies, 95), 3),
+        }
+    report["scheduler"] = scheduler.snapshot()
+    return report
+
+async def main(args):
+    return [await run_scenario(name, args) for name in ("unscheduled", "scheduled")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each scenario runs")
+    parser.add_argument("--rate-limit", type=int, default=20, help="calls the fake account accepts per window")
+    parser.add_argument("--window", type=float, default=2.0, help="rate-limit window in seconds (60 for OpenAI)")
+    parser.add_argument("--heavy-concurrency", type=int, default=24)
+    parser.add_argument("--light-users", type=int, default=6)
+    parser.add_argument("--max-queue-per-user", type=int, default=4)
+    parser.add_argument("--max-wait", type=float, default=5.0)
+    parser.add_argument("--llm-latency", default="lognormal:0.3,0.3")
+    parser.add_argument("--flag-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args)), indent=2))
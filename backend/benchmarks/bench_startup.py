@@ -0,0 +1,135 @@
+"""
+Measures cold start: how long `import app` takes, and how long a fresh uvicorn worker
+takes to answer /healthz, report ready on /readyz and serve its first chat request.
+
+The worker runs with LLM_BACKEND=fake and OCR_BACKEND=fake so no credentials are needed
+and the first request measures startup rather than OpenAI latency. The first request
+goes to /chatbot/stream, which records the turn (and counts its tokens) before the
+response ends, so the session work is timed too; /chatbot does that in a background
+task after the response. The fakes skip importing langchain_openai and the Huawei SDK,
+so separate scenarios time what a worker pays for the real clients after startup:
+building ChatOpenAI and the chain helpers with LLM_BACKEND=openai, and the Huawei OCR
+client with OCR_BACKEND=huawei. Nothing is sent, placeholder credentials are enough.
+Exits non-zero if any median goes over its threshold, so it can guard against
+import-time regressions.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py --runs 5 --max-import-s 1.0 --max-first-request-s 5.0 \
+        --max-openai-init-s 3.0 --max-ocr-init-s 3.0
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+
+from common import BACKEND_DIR
+import httpx
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+OPENAI_INIT_SNIPPET = "import time, app; started = time.perf_counter(); app.install_llm(); print(time.perf_counter() - started)"
+OCR_INIT_SNIPPET = "import time, app; started = time.perf_counter(); app.create_ocr_service(); print(time.perf_counter() - started)"
+
+def worker_env(llm_backend: str = "fake", ocr_backend: str = "fake") -> dict:
+    return {
+        **os.environ, "LLM_BACKEND": llm_backend, "OCR_BACKEND": ocr_backend, "PYTHONDONTWRITEBYTECODE": "1",
+        "CLOUD_SDK_AK": os.environ.get("CLOUD_SDK_AK", "benchmark-ak"), "CLOUD_SDK_SK": os.environ.get("CLOUD_SDK_SK", "benchmark-sk"),
+    }
+
+def measure_snippet(snippet: str, llm_backend: str = "fake", ocr_backend: str = "fake") -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=BACKEND_DIR, env=worker_env(llm_backend, ocr_backend),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(client: httpx.Client, method: str, path: str, deadline: float, **kwargs) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            if client.request(method, path, **kwargs).status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return False
+
+def measure_first_request(timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=worker_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    timings = {}
+    try:
+        deadline = started + timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            for name, method, path, kwargs in (
+                ("healthz_s", "GET", "/healthz", {}),
+                ("readyz_s", "GET", "/readyz", {}),
+                ("first_request_s", "POST", "/chatbot/stream", {"json": {"user_id": "startup-bench", "message": "Hi"}}),
+            ):
+                if not wait_for(client, method, path, deadline, **kwargs):
+                    raise TimeoutError(f"{path} did not succeed within {timeout}s")
+                timings[name] = round(time.perf_counter() - started, 3)
+    finally:
+        worker.terminate()
+        worker.wait()
+    return timings
+
+def main(runs: int, max_import_s: float, max_first_request_s: float, max_openai_init_s: float, max_ocr_init_s: float) -> int:
+    import_times = [measure_snippet(IMPORT_SNIPPET) for _ in range(runs)]
+    openai_init_times = [measure_snippet(OPENAI_INIT_SNIPPET, llm_backend="openai") for _ in range(runs)]
+    ocr_init_times = [measure_snippet(OCR_INIT_SNIPPET, ocr_backend="huawei") for _ in range(runs)]
+    starts = [measure_first_request(timeout=max(30.0, max_first_request_s * 3)) for _ in range(runs)]
+
+    report = {
+        "runs": runs,
+        "import_s": {"median": round(statistics.median(import_times), 3), "max": round(max(import_times), 3)},
+        "openai_init_s": {"median": round(statistics.median(openai_init_times), 3), "max": round(max(openai_init_times), 3)},
+        "ocr_init_s": {"median": round(statistics.median(ocr_init_times), 3), "max": round(max(ocr_init_times), 3)},
+        **{
+            key: {"median": round(statistics.median(s[key] for s in starts), 3), "max": max(s[key] for s in starts)}
+            for key in ("healthz_s", "readyz_s", "first_request_s")
+        },
+        "thresholds": {
+            "import_s": max_import_s, "first_request_s": max_first_request_s,
+            "openai_init_s": max_openai_init_s, "ocr_init_s": max_ocr_init_s
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if report["import_s"]["median"] > max_import_s:
+        print(f"FAIL: import took {report['import_s']['median']}s, threshold {max_import_s}s")
+        failed = True
+    if report["first_request_s"]["median"] > max_first_request_s:
+        print(f"FAIL: first request took {report['first_request_s']['median']}s, threshold {max_first_request_s}s")
+        failed = True
+    if report["openai_init_s"]["median"] > max_openai_init_s:
+        print(f"FAIL: building the OpenAI client took {report['openai_init_s']['median']}s, threshold {max_openai_init_s}s")
+        failed = True
+    if report["ocr_init_s"]["median"] > max_ocr_init_s:
+        print(f"FAIL: building the Huawei OCR client took {report['ocr_init_s']['median']}s, threshold {max_ocr_init_s}s")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-s", type=float, default=1.0)
+    parser.add_argument("--max-first-request-s", type=float, default=5.0)
+    parser.add_argument("--max-openai-init-s", type=float, default=3.0)
+    parser.add_argument("--max-ocr-init-s", type=float, default=3.0)
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.max_import_s, args.max_first_request_s, args.max_openai_init_s, args.max_ocr_init_s))
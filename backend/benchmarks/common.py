@@ -0,0 +1,38 @@
+""" Shared setup for the benchmark scripts """
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# Per-request logs would drown out the benchmark output
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+def unbounded_scheduler(backend):
+    """Scheduler that only caps concurrency, like the app's old semaphore, with no rate-limit budget or queue limits"""
+    from llm_scheduler import LLMScheduler
+    unbounded = 1_000_000_000
+    return LLMScheduler(
+        max_concurrency=backend.LLM_MAX_CONCURRENCY,
+        requests_per_minute=unbounded,
+        tokens_per_minute=unbounded,
+        max_queue=unbounded,
+        max_queue_per_user=unbounded,
+        max_wait=unbounded,
+        token_estimator=lambda chain: 0
+    )
+
+def install_fake_llm(backend, fake_llm):
+    """
+    Build the app's chain helpers around a fake LLM. The fake has no OpenAI account
+    behind it, so the scheduler's default budget is swapped for an unbounded one;
+    otherwise the benchmarks would measure that budget rather than the app.
+    """
+    backend.install_llm(fake_llm)
+    backend.llm_scheduler = unbounded_scheduler(backend)
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
@@ -0,0 +1,80 @@
+"""
+Compares the local pre-screen's decisions with the LLM evaluator on a saved transcript set.
+
+Each JSONL line needs "user_msg" and "response", plus the LLM evaluator's verdict under
+"evaluation". Lines without a saved verdict are skipped unless --live is given, in which
+case the real LLMEvaluator is called (needs OPENAI_API_KEY). Optional fields:
+"recent_user_msgs", the user's earlier messages in the session, and "red_flag", set on
+suicide, self-harm and overdose messages that must always reach the LLM evaluator.
+
+Usage (from backend/):
+    python benchmarks/eval_prescreen.py benchmarks/data/prescreen_transcripts.jsonl
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prescreen import ResponsePreScreener, needs_revision
+
+async def load_transcripts(path: str, live: bool) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        transcripts = [json.loads(line) for line in f if line.strip()]
+    if live:
+        import app as backend
+        # The app builds its LLM client after startup, so nothing is installed on import
+        backend.install_llm()
+        for transcript in transcripts:
+            if "evaluation" not in transcript:
+                transcript["evaluation"] = await backend.llm_evaluator.run_evaluator_chain(transcript["user_msg"], transcript["response"])
+    return [t for t in transcripts if "evaluation" in t]
+
+def evaluate(transcripts: list) -> dict:
+    prescreener = ResponsePreScreener()
+    report = {
+        "transcripts": len(transcripts),
+        "local_decisions": 0,
+        "revision_agreement": 0,
+        "conciseness_agreement": 0,
+        # Cases the pre-screen passed that the LLM evaluator flagged as unsafe; this must stay at 0
+        "missed_safety_concerns": 0,
+        # Cases the pre-screen passed that the LLM evaluator would have sent for revision
+        "missed_revisions": 0,
+        # Red-flag conversations the pre-screen decided locally; this must stay at 0 too
+        "missed_red_flags": 0,
+        "escalation_reasons": {}
+    }
+    for transcript in transcripts:
+        result, reason = prescreener.screen(transcript["user_msg"], transcript["response"], transcript.get("recent_user_msgs", ()))
+        expected = transcript["evaluation"]
+        if result is None:
+            report["escalation_reasons"][reason] = report["escalation_reasons"].get(reason, 0) + 1
+            continue
+        report["local_decisions"] += 1
+        if transcript.get("red_flag"):
+            report["missed_red_flags"] += 1
+        if needs_revision(result) == needs_revision(expected):
+            report["revision_agreement"] += 1
+        elif not needs_revision(result):
+            report["missed_revisions"] += 1
+        if result["conciseness_length"] == expected["conciseness_length"]:
+            report["conciseness_agreement"] += 1
+        if expected["safety_concern"]:
+            report["missed_safety_concerns"] += 1
+    local = report["local_decisions"]
+    report["hit_rate"] = round(local / len(transcripts), 3) if transcripts else 0.0
+    report["revision_agreement_rate"] = round(report["revision_agreement"] / local, 3) if local else 0.0
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("transcripts")
+    parser.add_argument("--live", action="store_true", help="call the LLM evaluator for lines without a saved verdict")
+    args = parser.parse_args()
+
+    report = evaluate(asyncio.run(load_transcripts(args.transcripts, args.live)))
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["missed_safety_concerns"] or report["missed_red_flags"] else 0)
@@ -0,0 +1,193 @@
+"""
+Offline load test of /chatbot and /huawei-ocr against fake LLM and OCR backends.
+
+Chat scenarios replay recorded conversation traces (see data/chat_traces.jsonl): each
+trace seeds a new session with its history, then sends its messages one after another,
+and --concurrency traces run at once. OCR scenarios post distinct fake images, each
+read as its own label text, so neither the image cache nor the med-info cache
+short-circuits. Every scenario runs in its own subprocess so peak RSS
+is per scenario.
+
+Latencies are distribution specs understood by fakes.LatencyDistribution, e.g.
+"0.8", "uniform:0.5,1.5" or "lognormal:0.8,0.4".
+
+Results are printed as JSON and, with --output, appended as one JSON line per run so
+runs can be compared over time.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 200 --llm-latency lognormal:0.8,0.4 --output load_test_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import subprocess
+
+from common import install_fake_llm, percentile
+
+TRACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chat_traces.jsonl")
+
+def load_traces(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def make_requests(endpoint: str, num_requests: int, traces: list) -> list:
+    """Split the request budget into sequences that each run on one worker: a trace for /chatbot, one image for OCR"""
+    if endpoint == "ocr":
+        return [[{"image_base64": base64.b64encode(f"load-test-label-{i}".encode()).decode("ascii")}] for i in range(num_requests)]
+    sequences, sent, n = [], 0, 0
+    while sent < num_requests:
+        trace = traces[n % len(traces)]
+        user_id = f"{trace['trace_id']}-{n}"
+        messages = trace["messages"][:num_requests - sent]
+        sequences.append([
+            # Only the first request seeds the session, like a client migrating its local history
+            {"user_id": user_id, "message": message, "chat_history": trace["chat_history"] if i == 0 else []}
+            for i, message in enumerate(messages)
+        ])
+        sent += len(messages)
+        n += 1
+    return sequences
+
+async def run_scenario(scenario: dict) -> dict:
+    import httpx
+    import app as backend
+    from fakes import FakeChatModel, FakeOcrService, LatencyDistribution, make_responder
+    from ocr_cache import create_ocr_cache
+    from sessions import create_session_store
+
+    seed = scenario["seed"]
+    fake_llm = FakeChatModel(
+        latency_sampler=LatencyDistribution(scenario["llm_latency"], seed=seed).sample,
+        failure_rate=scenario["llm_failure_rate"],
+        rng=random.Random(seed + 1).random,
+        responder=make_responder(scenario["flag_rate"], seed=seed)
+    )
+    install_fake_llm(backend, fake_llm)
+    backend.ocr_service = FakeOcrService(
+        latency_sampler=LatencyDistribution(scenario["ocr_latency"], seed=seed + 2).sample,
+        failure_rate=scenario["ocr_failure_rate"],
+        seed=seed + 3,
+        unique_per_image=True,
+        max_workers=backend.OCR_MAX_WORKERS,
+        timeout=backend.OCR_TIMEOUT,
+        max_retries=backend.OCR_MAX_RETRIES,
+        backoff=0.05
+    )
+    backend.ocr_cache = create_ocr_cache("memory", "", 100000, 3600)
+    backend.session_store = create_session_store("memory", "")
+    for name, value in scenario["settings"].items():
+        setattr(backend, name, value)
+
+    path = "/chatbot" if scenario["endpoint"] == "chat" else "/huawei-ocr"
+    queue = asyncio.Queue()
+    for sequence in make_requests(scenario["endpoint"], scenario["requests"], load_traces(scenario["traces"])):
+        queue.put_nowait(sequence)
+    latencies, errors = [], 0
+
+    transport = httpx.ASGITransport(app=backend.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                for body in queue.get_nowait():
+                    started = time.perf_counter()
+                    response = await client.post(path, json=body)
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200 or "error" in response.json():
+                        errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(scenario["concurrency"])))
+        elapsed = time.perf_counter() - started
+    backend.ocr_service.close()
+
+    # The ASGI transport waits for background tasks, so history compaction calls are included
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_time_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        "latency_max_s": round(max(latencies), 3),
+        "llm_calls_per_request": round(fake_llm.calls / len(latencies), 2),
+        "llm_failures": fake_llm.failures,
+        "ocr_calls_per_request": round(backend.ocr_service.calls / len(latencies), 2),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main(args):
+    scenarios = []
+    for endpoint in args.endpoints.split(","):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            scenarios.append({
+                "endpoint": endpoint,
+                "concurrency": concurrency,
+                "requests": args.requests,
+                "traces": args.traces,
+                "llm_latency": args.llm_latency,
+                "llm_failure_rate": args.llm_failure_rate,
+                "flag_rate": args.flag_rate,
+                "ocr_latency": args.ocr_latency,
+                "ocr_failure_rate": args.ocr_failure_rate,
+                "seed": args.seed,
+                "settings": {"CHAT_PIPELINE_MODE": args.pipeline_mode, "PRESCREEN_ENABLED": not args.no_prescreen},
+            })
+
+    results = []
+    for scenario in scenarios:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(scenario)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append({"endpoint": scenario["endpoint"], "concurrency": scenario["concurrency"], **result})
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in scenarios[0].items() if k not in ("endpoint", "concurrency")},
+        "scenarios": results,
+    }
+    print(json.dumps(run, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoints", default="chat,ocr", help="comma-separated: chat, ocr")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--traces", default=TRACES_PATH)
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--flag-rate", type=float, default=0.2, help="fraction of companion replies that come out too long, which the pre-screen or evaluator sends to the revisor")
+    parser.add_argument("--ocr-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--ocr-failure-rate", type=float, default=0.0)
+    parser.add_argument("--pipeline-mode", default="standard", choices=["standard", "self_check"])
+    parser.add_argument("--no-prescreen", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="append the run as one JSON line to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(asyncio.run(run_scenario(json.loads(args.worker)))))
+    else:
+        main(args)
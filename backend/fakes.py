@@ -0,0 +1,232 @@
+""" Local stand-ins for the cloud backends, used by the benchmark scripts """
+import re
+import math
+import time
+import json
+import random
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from huaweicloudsdkcore.exceptions import exceptions
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from ocr_client import OcrService
+
+PASSING_EVALUATION = {
+    "emotional_tone": True,
+    "helpful": True,
+    "safety_concern": False,
+    "conciseness_length": True,
+    "comments": {
+        "emotional_tone": "Fake evaluator: warm tone.",
+        "helpful": "Fake evaluator: helpful.",
+        "safety_concern": "Fake evaluator: no safety issues.",
+        "conciseness_length": "Fake evaluator: concise."
+    }
+}
+
+FAKE_LABEL_TEXT = (
+    "TAN TOCK SENG HOSPITAL PHARMACY SERTRALINE 50MG TABLET Take ONE tablet every morning "
+    "Take with food. Do not stop taking this medicine unless advised by your doctor."
+)
+
+FAKE_MED_INFO = {
+    "medicine_name": "Sertraline",
+    "dosage": "50mg",
+    "frequency": "One tablet every morning",
+    "duration": "No set duration",
+    "additional_notes": "Take with food."
+}
+
+class LatencyDistribution:
+    """
+    Per-call latency in seconds, parsed from a spec string:
+    "0.5" (fixed), "uniform:LOW,HIGH", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA".
+    Lognormal gives the long right tail real API latencies have.
+    """
+    def __init__(self, spec: str, seed: Optional[int] = None):
+        self.spec = spec
+        self.rng = random.Random(seed)
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(*self.params))
+        median, sigma = self.params
+        return self.rng.lognormvariate(math.log(median), sigma)
+
+class FakeBackendError(Exception):
+    """Injected failure from a fake LLM"""
+
+class FakeRateLimitError(FakeBackendError):
+    """Shaped like openai.RateLimitError as far as the scheduler's rate-limit observer looks"""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Fake LLM rate limit reached")
+        self.response = SimpleNamespace(headers={"retry-after": f"{retry_after:.3f}"})
+
+FAKE_REPLY = "That sounds like a lot to carry today. I'm here with you - what's been weighing on you most?"
+# Over the three-sentence limit, so the pre-screen and the fake evaluator both send it to the revisor
+FAKE_LONG_REPLY = (
+    FAKE_REPLY + " It's okay to have days like this. Lots of people find it hard to keep a routine."
+    " Maybe a phone reminder could help next time. Would you like to talk it through?"
+)
+
+def make_responder(flag_rate: float = 0.0, seed: Optional[int] = None) -> Callable[[List[BaseMessage]], str]:
+    """
+    Pick a canned reply based on which chain the prompt belongs to. `flag_rate` is
+    the fraction of companion replies (and self-checks) that come out too long. The
+    local pre-screen and the fake evaluator both flag those, so the same fraction of
+    turns reaches the revisor whichever evaluation path runs.
+    """
+    rng = random.Random(seed)
+
+    def companion_reply() -> str:
+        return FAKE_LONG_REPLY if rng.random() < flag_rate else FAKE_REPLY
+
+    def evaluation(response: str) -> dict:
+        if FAKE_LONG_REPLY in response:
+            return {**PASSING_EVALUATION, "conciseness_length": False}
+        return dict(PASSING_EVALUATION)
+
+    def responder(messages: List[BaseMessage]) -> str:
+        system_prompt = "\n".join(m.content for m in messages if m.type == "system")
+        if "response evaluator" in system_prompt:
+            return json.dumps(evaluation(messages[-1].content))
+        if "self-assessment" in system_prompt:
+            reply = companion_reply()
+            return json.dumps({"reply": reply, **evaluation(reply)})
+        if "multiple medication labels" in system_prompt:
+            labels = len(re.findall(r"^Label \d+:", messages[-1].content, re.MULTILINE))
+            return json.dumps({"medications": [FAKE_MED_INFO] * labels})
+        if "extracts medication details" in system_prompt:
+            return json.dumps(FAKE_MED_INFO)
+        if "Revise the initially proposed" in system_prompt or "running summary" in system_prompt:
+            return FAKE_REPLY
+        return companion_reply()
+
+    return responder
+
+default_responder = make_responder()
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that sleeps for `latency` seconds (or a sample from `latency_sampler`)
+    and returns canned text, failing a `failure_rate` fraction of calls.
+
+    With `rate_limit` set it also behaves like a rate-limited OpenAI account: at most
+    that many calls start per `rate_limit_window` seconds, the rest fail straight away
+    with a 429, and successful responses carry x-ratelimit-* headers.
+    """
+    latency: float = 0.5
+    latency_sampler: Optional[Callable[[], float]] = None
+    failure_rate: float = 0.0
+    rng: Callable[[], float] = random.random
+    responder: Callable[[List[BaseMessage]], str] = default_responder
+    rate_limit: int = 0
+    rate_limit_window: float = 60.0
+    calls: int = 0
+    failures: int = 0
+    rate_limited: int = 0
+    call_starts: List[float] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _call_latency(self) -> float:
+        return self.latency_sampler() if self.latency_sampler else self.latency
+
+    def _start_call(self) -> Dict[str, str]:
+        """Count the call against the rate limit, returning the headers its response would carry"""
+        self.calls += 1
+        if not self.rate_limit:
+            return {}
+        now = time.monotonic()
+        self.call_starts = [t for t in self.call_starts if t > now - self.rate_limit_window]
+        if len(self.call_starts) >= self.rate_limit:
+            self.rate_limited += 1
+            raise FakeRateLimitError(retry_after=self.call_starts[0] + self.rate_limit_window - now)
+        self.call_starts.append(now)
+        return {
+            "x-ratelimit-limit-requests": str(self.rate_limit),
+            "x-ratelimit-remaining-requests": str(self.rate_limit - len(self.call_starts)),
+        }
+
+    def _result(self, messages: List[BaseMessage], headers: Dict[str, str]) -> ChatResult:
+        if self.failure_rate and self.rng() < self.failure_rate:
+            self.failures += 1
+            raise FakeBackendError("Injected fake LLM failure")
+        message = AIMessage(content=self.responder(messages), response_metadata={"headers": headers} if headers else {})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        headers = self._start_call()
+        time.sleep(self._call_latency())
+        return self._result(messages, headers)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        headers = self._start_call()
+        await asyncio.sleep(self._call_latency())
+        return self._result(messages, headers)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Spread the latency over word-sized chunks so streaming behaves like the real API
+        headers = self._start_call()
+        if self.failure_rate and self.rng() < self.failure_rate:
+            self.failures += 1
+            raise FakeBackendError("Injected fake LLM failure")
+        words = self.responder(messages).split(" ")
+        latency = self._call_latency()
+        for i, word in enumerate(words):
+            await asyncio.sleep(latency / len(words))
+            text = word if i == 0 else " " + word
+            # Like OpenAI, the headers arrive with the first chunk
+            metadata = {"headers": headers} if headers and i == 0 else {}
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, response_metadata=metadata))
+
+class FakeOcrService(OcrService):
+    """
+    OCR backend that blocks a pool thread for `latency` seconds (or a sample from
+    `latency_sampler`), like the real SDK call. A `failure_rate` fraction of calls
+    fail with the 5xx error the SDK raises, which the retry logic treats as retryable.
+    With `unique_per_image`, each distinct image reads as a label with its own lot
+    number, so the med-info cache (keyed by OCR text) only hits on repeat scans.
+    """
+    def __init__(self, latency: float = 1.0, text: str = FAKE_LABEL_TEXT, latency_sampler: Optional[Callable[[], float]] = None,
+                 failure_rate: float = 0.0, seed: Optional[int] = None, unique_per_image: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.unique_per_image = unique_per_image
+        self.latency = latency
+        self.latency_sampler = latency_sampler
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.text = text
+        self.calls = 0
+        self.failures = 0
+        # Total base64 characters forwarded to OCR, i.e. what the cloud upload would cost
+        self.image_chars = 0
+
+    def _recognize(self, image_base64: str) -> str:
+        self.calls += 1
+        self.image_chars += len(image_base64)
+        time.sleep(self.latency_sampler() if self.latency_sampler else self.latency)
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise exceptions.ServerResponseException(503, exceptions.SdkError(error_code="FAKE.0503", error_msg="Injected fake OCR failure"))
+        if self.unique_per_image:
+            return f"{self.text} Lot no. {hashlib.sha256(image_base64.encode('ascii')).hexdigest()[:8].upper()}"
+        return self.text
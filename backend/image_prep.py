@@ -0,0 +1,20 @@
+""" Shrinks uploaded label photos to what OCR actually needs before they leave the server """
+import io
+
+def prepare_image_for_ocr(data: bytes, max_side: int = 2048, quality: int = 85) -> bytes:
+    """
+    Decode, apply the EXIF orientation, downscale so the longest side is at most
+    `max_side` and recompress as JPEG. Raises PIL.UnidentifiedImageError for
+    non-images and PIL.Image.DecompressionBombError for absurd dimensions.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as img:
+        # Lets the JPEG decoder skip straight to a reduced scale instead of decoding full size
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
@@ -0,0 +1,272 @@
+""" Shared scheduler in front of every LLM call: rate-limit budgets, per-user fair queuing and backpressure """
+import re
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Mapping, Optional, Tuple
+from telemetry import get_logger, stage_duration
+
+log = get_logger("scheduler")
+
+# Lower runs first. Safety-relevant evaluator calls jump the queue, history compaction waits.
+PRIORITY_SAFETY = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+_request_user: ContextVar[str] = ContextVar("request_user", default="anonymous")
+
+def set_request_user(user_id: str) -> None:
+    """LLM calls awaited from here on are queued under this user"""
+    _request_user.set(user_id)
+
+class LLMOverloaded(Exception):
+    """The scheduler is shedding load; `retry_after` is a hint in seconds"""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM scheduler overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+_duration_regex = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_reset(value: str) -> Optional[float]:
+    """OpenAI reset headers look like "1s", "6m0s" or "20ms" """
+    parts = _duration_regex.findall(value or "")
+    return sum(float(n) * _duration_units[unit] for n, unit in parts) if parts else None
+
+def provider_retry_after(error: BaseException) -> Optional[float]:
+    """Seconds a provider 429 asks us to wait, from Retry-After or OpenAI's reset header"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    return float(retry_after) if retry_after else parse_reset(headers.get("x-ratelimit-reset-requests", ""))
+
+class TokenBucket:
+    """Continuously refilling budget of `limit` units per `window` seconds"""
+    def __init__(self, limit: float, window: float):
+        self.window = window
+        self.limit = limit
+        self.tokens = limit
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.window)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available; a call bigger than the whole budget only needs a full bucket"""
+        self._refill()
+        amount = min(amount, self.limit)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) * self.window / self.limit
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.limit)
+
+    def set_limit(self, limit: float) -> None:
+        self._refill()
+        self.limit = limit
+        self.tokens = min(self.tokens, limit)
+
+    def sync_remaining(self, remaining: float) -> None:
+        """The provider's count covers every worker sharing the API key, so never assume more than it reports"""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+class _Waiter:
+    def __init__(self, user_id: str, tokens: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class LLMScheduler:
+    """
+    Admits LLM calls when there is concurrency and rate-limit budget for them.
+    Waiting calls are served by priority, and round-robin across users within a
+    priority, so one heavy user cannot starve the others. Calls that would exceed
+    the queue limits, or wait longer than `max_wait`, raise LLMOverloaded.
+    """
+    def __init__(self, max_concurrency: int, requests_per_minute: float, tokens_per_minute: float,
+                 max_queue: int, max_queue_per_user: int, max_wait: float,
+                 token_estimator: Callable[[str], int], window: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute, window)
+        self.tokens = TokenBucket(tokens_per_minute, window)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.token_estimator = token_estimator
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        # priority -> user_id -> waiters, users in round-robin order
+        self.queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self.waiting = 0
+        self.waiting_per_user: Dict[str, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "rate_limited": 0}
+
+    def _budget_wait(self, tokens: int) -> float:
+        return max(self.blocked_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _admit(self, tokens: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued call would start"""
+        per_call = self.requests.window / self.requests.limit if self.requests.limit else 1.0
+        return round(max(1.0, self._budget_wait(0), self.waiting * per_call), 1)
+
+    def is_saturated(self) -> bool:
+        return self.waiting >= self.max_queue
+
+    def _next_waiter(self) -> Optional[Tuple[int, _Waiter]]:
+        for priority in sorted(self.queues):
+            users = self.queues[priority]
+            if users:
+                return priority, next(iter(users.values()))[0]
+        return None
+
+    def _dequeue(self, priority: int, waiter: _Waiter, rotate: bool = True) -> None:
+        users = self.queues[priority]
+        waiters = users[waiter.user_id]
+        waiters.remove(waiter)
+        if waiters:
+            if rotate:
+                # Back of the line for this user's next call
+                users.move_to_end(waiter.user_id)
+        else:
+            del users[waiter.user_id]
+        self.waiting -= 1
+        self.waiting_per_user[waiter.user_id] -= 1
+        if not self.waiting_per_user[waiter.user_id]:
+            del self.waiting_per_user[waiter.user_id]
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        while self.in_flight < self.max_concurrency:
+            head = self._next_waiter()
+            if head is None:
+                return
+            priority, waiter = head
+            wait = self._budget_wait(waiter.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            self._dequeue(priority, waiter)
+            self._admit(waiter.tokens)
+            waiter.future.set_result(None)
+
+    def _wake(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    async def acquire(self, chain: str, priority: int) -> None:
+        user_id = _request_user.get()
+        tokens = self.token_estimator(chain)
+        if not self.waiting and self.in_flight < self.max_concurrency and self._budget_wait(tokens) <= 0:
+            self._admit(tokens)
+            return
+        if self.waiting >= self.max_queue or self.waiting_per_user.get(user_id, 0) >= self.max_queue_per_user:
+            self.stats["rejected_queue_full"] += 1
+            raise LLMOverloaded("queue_full", self.retry_after())
+
+        waiter = _Waiter(user_id, tokens, asyncio.get_running_loop().create_future())
+        self.queues.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(waiter)
+        self.waiting += 1
+        self.waiting_per_user[user_id] = self.waiting_per_user.get(user_id, 0) + 1
+        self.stats["queued"] += 1
+        self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Admitted just as we gave up, hand the slot back
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._dequeue(priority, waiter, rotate=False)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.stats["rejected_timeout"] += 1
+            raise LLMOverloaded("queue_timeout", self.retry_after())
+        finally:
+            stage_duration.observe(time.monotonic() - waiter.enqueued, stage="llm_queue")
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self.waiting:
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, chain: str, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Hold one admitted LLM call for the duration of the block. A 429 from the
+        provider inside the block is raised as LLMOverloaded, so callers shed it like
+        their own queue being full instead of treating it as a failed call.
+        """
+        await self.acquire(chain, priority)
+        try:
+            yield
+        except Exception as e:
+            if getattr(e, "status_code", None) != 429:
+                raise
+            retry_after = provider_retry_after(e)
+            raise LLMOverloaded("provider_rate_limited", retry_after if retry_after is not None else self.retry_after()) from e
+        finally:
+            self.release()
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Adapt the budgets to OpenAI's x-ratelimit-* response headers"""
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if limit and float(limit) != bucket.limit:
+                log.info("Adapting LLM rate limit to provider headers", extra={"kind": kind, "limit": float(limit)})
+                bucket.set_limit(float(limit))
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None:
+                bucket.sync_remaining(float(remaining))
+
+    def observe_rate_limited(self, retry_after: Optional[float]) -> None:
+        """The provider returned 429: stop admitting calls until it says to retry"""
+        self.stats["rate_limited"] += 1
+        pause = retry_after if retry_after is not None else self.requests.window / self.requests.limit
+        self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        log.warning("LLM provider rate limited, pausing admissions", extra={"pause_s": round(pause, 2)})
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests_budget": round(self.requests.tokens, 1),
+            "tokens_budget": round(self.tokens.tokens, 1),
+            "requests_limit": self.requests.limit,
+            "tokens_limit": self.tokens.limit,
+        }
+
+def rate_limit_observer(scheduler: LLMScheduler):
+    """LangChain callback feeding response headers and 429s from the chat model back into the scheduler"""
+    from langchain_core.callbacks import AsyncCallbackHandler
+
+    class RateLimitObserver(AsyncCallbackHandler):
+        async def on_llm_end(self, response, **kwargs) -> None:
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    headers = getattr(message, "response_metadata", {}).get("headers") if message is not None else None
+                    if headers:
+                        scheduler.observe_headers({k.lower(): v for k, v in headers.items()})
+
+        async def on_llm_error(self, error: BaseException, **kwargs) -> None:
+            if getattr(error, "status_code", None) != 429:
+                return
+            scheduler.observe_rate_limited(provider_retry_after(error))
+
+    return RateLimitObserver()
@@ -0,0 +1,336 @@
+""" Rule-based first pass over OCR'd pharmacy labels, run before the LLM extractor """
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+MED_INFO_KEYS = ["medicine_name", "dosage", "frequency", "duration", "additional_notes"]
+
+# Generic names commonly dispensed by Singapore pharmacies, psychiatric medications first
+DRUG_NAMES = [
+    "Sertraline", "Fluoxetine", "Escitalopram", "Citalopram", "Paroxetine", "Fluvoxamine", "Venlafaxine",
+    "Desvenlafaxine", "Duloxetine", "Mirtazapine", "Bupropion", "Agomelatine", "Vortioxetine", "Trazodone",
+    "Amitriptyline", "Nortriptyline", "Clomipramine", "Imipramine", "Moclobemide", "Methylphenidate",
+    "Atomoxetine", "Lisdexamfetamine", "Guanfacine", "Clonidine", "Quetiapine", "Olanzapine", "Risperidone",
+    "Aripiprazole", "Haloperidol", "Lurasidone", "Paliperidone", "Clozapine", "Ziprasidone", "Amisulpride",
+    "Chlorpromazine", "Lithium Carbonate", "Sodium Valproate", "Lamotrigine", "Carbamazepine", "Topiramate",
+    "Gabapentin", "Pregabalin", "Diazepam", "Lorazepam", "Alprazolam", "Clonazepam", "Zolpidem", "Melatonin",
+    "Propranolol", "Hydroxyzine", "Promethazine", "Buspirone", "Benzhexol", "Procyclidine",
+    "Paracetamol", "Ibuprofen", "Naproxen", "Diclofenac", "Mefenamic Acid", "Tramadol", "Aspirin",
+    "Amoxicillin", "Augmentin", "Azithromycin", "Doxycycline", "Ciprofloxacin", "Cephalexin", "Clarithromycin",
+    "Cetirizine", "Loratadine", "Fexofenadine", "Chlorpheniramine", "Dextromethorphan", "Montelukast",
+    "Salbutamol", "Fluticasone", "Budesonide", "Prednisolone", "Omeprazole", "Esomeprazole", "Pantoprazole",
+    "Famotidine", "Domperidone", "Metoclopramide", "Loperamide", "Metformin", "Gliclazide", "Sitagliptin",
+    "Amlodipine", "Losartan", "Atenolol", "Bisoprolol", "Atorvastatin", "Simvastatin", "Rosuvastatin",
+    "Ezetimibe", "Clopidogrel", "Levothyroxine", "Ferrous Fumarate", "Folic Acid", "Vitamin D3",
+]
+
+# Characters OCR commonly misreads inside words
+OCR_CONFUSIONS = str.maketrans({"0": "o", "1": "l", "5": "s", "8": "b", "|": "l", "$": "s"})
+
+NUMBER_WORDS = {
+    "1": "One", "2": "Two", "3": "Three", "4": "Four", "half": "Half", "½": "Half",
+    "one": "One", "two": "Two", "three": "Three", "four": "Four",
+}
+FORM_WORDS = r"(tablet|tab|capsule|cap|sachet|puff|drop|spoonful|teaspoon|ml)s?"
+FORM_ABBREVIATIONS = {"tab": "tablet", "cap": "capsule"}
+TIMING_PHRASES = (
+    r"every\s+morning|every\s+night|every\s+evening|in\s+the\s+morning|at\s+night|at\s+bedtime|before\s+bed(?:time)?"
+    r"|once\s+a\s+day|twice\s+a\s+day|three\s+times\s+a\s+day|four\s+times\s+a\s+day"
+    r"|once\s+daily|twice\s+daily|three\s+times\s+daily|daily|every\s+\d+\s+hours"
+    r"|when\s+(?:needed|required)|as\s+needed"
+)
+# Latin shorthand printed on some labels, matched in capitals only so English "on" isn't mistaken for it
+FREQUENCY_ABBREVIATIONS = {
+    "bd": "Twice a day", "bid": "Twice a day", "tds": "Three times a day", "tid": "Three times a day",
+    "qid": "Four times a day", "prn": "When needed",
+}
+# Also English words ("STOP ONLY ON DOCTOR'S ADVICE"), so only read straight after a dose ("1 TAB ON")
+DOSE_ABBREVIATIONS = {"om": "Every morning", "on": "Every night"}
+
+_word_regex = re.compile(r"[A-Za-z0-9|$]+")
+_amount_regex = re.compile(r"^\d+(?:\.\d+)?[A-Za-zµ]*$")
+_dosage_regex = re.compile(r"(?<![\w.])(\d+(?:\.\d+)?)\s*(mg|mcg|µg|g|ml|iu)\b", re.IGNORECASE)
+_frequency_regex = re.compile(
+    rf"\b(?:take\s+)?(?P<qty>\d|one|two|three|four|half|½)\s+(?P<form>{FORM_WORDS})\s+(?P<when>{TIMING_PHRASES})\b",
+    re.IGNORECASE
+)
+_timing_regex = re.compile(rf"\b(?P<when>{TIMING_PHRASES})\b", re.IGNORECASE)
+_abbreviation_regex = re.compile(r"\b(" + "|".join(a.upper() for a in FREQUENCY_ABBREVIATIONS) + r")\b(?!\s+(?:AN|THE|A)\b)")
+_dose_abbreviation_regex = re.compile(
+    rf"(?i:\b(?:take\s+)?(?P<qty>\d|one|two|three|four|half|½)\s+(?P<form>{FORM_WORDS})\s+)"
+    r"(?P<when>" + "|".join(a.upper() for a in {**FREQUENCY_ABBREVIATIONS, **DOSE_ABBREVIATIONS}) + r")\b"
+)
+# A quantity the dose patterns couldn't read, e.g. when OCR garbled the form ("2 tablcts")
+_unread_quantity_regex = re.compile(r"\btake\s+(\d|one|two|three|four|half|½)\b", re.IGNORECASE)
+# Wording the frequency patterns don't capture: conditions, tapers and multi-step regimens
+_qualifier_regex = re.compile(
+    r"\b(then|followed\s+by|thereafter|afterwards|taper\w*|reduc\w+|increas\w+|alternate|(as|when|if)\s+(needed|required|necessary)|prn"
+    r"|only|except|on\s+\w+\s+days|max\w*|up\s+to|not\s+more\s+than)\b",
+    re.IGNORECASE
+)
+# Advice the note patterns don't cover; a label with any of it left over needs the LLM for its notes
+_advice_regex = re.compile(
+    r"\b(stop|avoid|do\s+not|don'?t|never|may|should|must|only|keep|store|driv\w+|advi[cs]e\w*|doctor|pharmacist|warning|caution|shake|apply|dissolve|chew|crush)\b",
+    re.IGNORECASE
+)
+_duration_regex = re.compile(r"\b(?:for|x)\s*(\d+)\s*(day|week|month)s?\b", re.IGNORECASE)
+_long_term_regex = re.compile(r"\b(long[\s-]term|no\s+set\s+duration|until\s+further\s+notice)\b", re.IGNORECASE)
+NOTE_PATTERNS = [
+    (re.compile(r"\bwith\s+or\s+without\s+food\b", re.IGNORECASE), "May be taken with or without food."),
+    (re.compile(r"\b(take\s+)?(with|after)\s+(food|meals?)\b", re.IGNORECASE), "Take with food."),
+    (re.compile(r"\b(take\s+)?before\s+(food|meals?)\b", re.IGNORECASE), "Take before food."),
+    (re.compile(r"\bon\s+an\s+empty\s+stomach\b", re.IGNORECASE), "Take on an empty stomach."),
+    (re.compile(r"\bmay\s+cause\s+drowsiness\b", re.IGNORECASE), "May cause drowsiness."),
+    (re.compile(r"\bavoid\s+(alcohol|alcoholic\s+drinks?)\b", re.IGNORECASE), "Avoid alcohol."),
+    (re.compile(r"\bswallow\s+whole(,?\s+(do\s+not|don'?t)\s+(crush|chew)(\s+or\s+(crush|chew))?)?\b", re.IGNORECASE), "Swallow whole."),
+    (re.compile(r"\bcomplete\s+the\s+(whole\s+|full\s+)?course\b", re.IGNORECASE), "Complete the whole course."),
+    (re.compile(r"\b(do\s+not|don'?t)\s+stop\b.*?\bdoctor\b", re.IGNORECASE), "Stop medication only on doctor's advice."),
+    (re.compile(r"\bstop\s+only\s+on\s+(the\s+)?doctor'?s\s+advice\b", re.IGNORECASE), "Stop medication only on doctor's advice."),
+]
+
+def _normalise(word: str) -> str:
+    return re.sub(r"[^a-z]", "", word.lower().translate(OCR_CONFUSIONS))
+
+def _trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up early once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class DrugNameIndex:
+    """Trigram index over drug names, tolerant of the character errors OCR makes"""
+    def __init__(self, names: List[str]):
+        self.names: Dict[str, str] = {}
+        self.key_trigrams: Dict[str, set] = {}
+        self.index: Dict[str, set] = defaultdict(set)
+        for name in names:
+            key = _normalise(name)
+            self.names[key] = name
+            self.key_trigrams[key] = _trigrams(key)
+            for gram in self.key_trigrams[key]:
+                self.index[gram].add(key)
+        # Label headers and instructions repeat across scans, so most queries have been seen before
+        self._lookup_normalised = lru_cache(maxsize=4096)(self._lookup_normalised)
+
+    def lookup(self, word: str) -> Tuple[Optional[str], float]:
+        """Return the best matching drug name and a 0-1 confidence"""
+        return self._lookup_normalised(_normalise(word))
+
+    def _lookup_normalised(self, query: str) -> Tuple[Optional[str], float]:
+        if len(query) < 4:
+            return None, 0.0
+        if query in self.names:
+            return self.names[query], 1.0
+
+        grams = _trigrams(query)
+        counts: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for key in self.index.get(gram, ()):
+                counts[key] += 1
+        best, best_score = None, 0.0
+        for key, shared in counts.items():
+            # Cheap trigram overlap filter before the exact edit distance
+            if shared / len(grams | self.key_trigrams[key]) < 0.3:
+                continue
+            limit = max(1, len(key) // 5)
+            distance = _edit_distance(query, key, limit)
+            if distance > limit:
+                continue
+            score = 1 - distance / len(key)
+            if score > best_score:
+                best, best_score = key, score
+        return (self.names[best], best_score) if best else (None, 0.0)
+
+drug_name_index = DrugNameIndex(DRUG_NAMES)
+
+def _find_medicine_name(text: str) -> Tuple[Optional[str], float]:
+    words = _word_regex.findall(text)
+    best, best_score = None, 0.0
+    # Two-word names ("Sodium Valproate") first, then single words
+    candidates = [" ".join(words[i:i + 2]) for i in range(len(words) - 1)] + words
+    for candidate in candidates:
+        name, score = drug_name_index.lookup(candidate)
+        if score > best_score:
+            best, best_score = name, score
+            if score == 1.0:
+                break
+    return best, best_score
+
+def _find_dosage(text: str) -> Optional[str]:
+    doses = {f"{amount}{unit.lower().replace('µg', 'mcg')}" for amount, unit in _dosage_regex.findall(text)}
+    # Several different strengths on one label (e.g. combination products) need a human-like read
+    return doses.pop() if len(doses) == 1 else None
+
+def _sentence_case(phrase: str) -> str:
+    phrase = re.sub(r"\s+", " ", phrase.strip().lower())
+    return phrase[:1].upper() + phrase[1:]
+
+def _format_dose(match: re.Match, when: str) -> str:
+    quantity = NUMBER_WORDS[match.group("qty").lower()]
+    form = match.group("form").lower().rstrip("s")
+    form = FORM_ABBREVIATIONS.get(form, form)
+    # "Half tablet", "One tablet", "Two tablets"
+    form = form.rstrip("s") if quantity in ("One", "Half") else form.rstrip("s") + "s"
+    return f"{quantity} {form} {when.lower()}"
+
+def _find_frequency(text: str) -> Tuple[Optional[str], Tuple[int, int]]:
+    """The frequency and the span of text it was read from"""
+    match = _frequency_regex.search(text)
+    if match:
+        return _format_dose(match, _sentence_case(match.group("when"))), match.span()
+    match = _dose_abbreviation_regex.search(text)
+    if match:
+        when = match.group("when").lower()
+        return _format_dose(match, {**FREQUENCY_ABBREVIATIONS, **DOSE_ABBREVIATIONS}[when]), match.span()
+    if _unread_quantity_regex.search(text):
+        # Timing alone would drop how many to take
+        return None, (0, 0)
+    match = _timing_regex.search(text)
+    if match:
+        return _sentence_case(match.group("when")), match.span()
+    match = _abbreviation_regex.search(text)
+    if match:
+        return FREQUENCY_ABBREVIATIONS[match.group(1).lower()], match.span()
+    return None, (0, 0)
+
+def _find_duration(text: str) -> Tuple[Optional[str], Tuple[int, int]]:
+    """The duration and the span of text it was read from"""
+    match = _duration_regex.search(text)
+    if match:
+        count, unit = match.group(1), match.group(2).lower()
+        return f"{count} {unit}{'' if count == '1' else 's'}", match.span()
+    match = _long_term_regex.search(text)
+    if match:
+        return "No set duration", match.span()
+    return None, (0, 0)
+
+def _find_notes(text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """The notes in label order, and every span of text a note pattern matched"""
+    found: Dict[str, int] = {}
+    spans = []
+    for regex, note in NOTE_PATTERNS:
+        for match in regex.finditer(text):
+            spans.append(match.span())
+            # "with or without food" also matches the plain "with food" pattern
+            if note in found or (note == "Take with food." and "May be taken with or without food." in found):
+                continue
+            found[note] = match.start()
+    # Keep the order the label printed them in
+    return sorted(found, key=found.get), spans
+
+# Keywords of the two checks above, matched again allowing one misread character ("Avold", "nceded")
+QUALIFIER_WORDS = ["then", "needed", "required", "necessary", "taper", "reduce", "increase", "followed",
+                   "thereafter", "alternate", "only", "except", "maximum"]
+ADVICE_WORDS = ["stop", "avoid", "never", "should", "must", "only", "keep", "store", "driving", "advice", "advised",
+                "doctor", "pharmacist", "warning", "caution", "shake", "apply", "dissolve", "crush",
+                # Vocabulary of the note patterns, left over when OCR garbled one ("Take after mcals")
+                "food", "meals", "empty", "stomach", "drowsiness", "alcohol", "swallow", "whole", "course"]
+# Dosing wording that, left over once everything else is read, means part of the instructions wasn't
+INSTRUCTION_WORDS = ["take", "taking", "daily", "days", "weeks", "months", "hours", "times", "until", "continue",
+                     "dose", "doses", "morning", "night", "bedtime", "apply", "inhale", "insert", "course"]
+_instruction_regex = re.compile(r"(day|week|month|hr|wk)s?", re.IGNORECASE)
+
+def _deletions(word: str) -> set:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+class FuzzyKeywords:
+    """
+    Keywords matched allowing one edit. Any word within one edit of a keyword shares
+    a single-deletion variant with it, so candidates come from a dict lookup per
+    variant instead of an edit distance against every keyword.
+    """
+    def __init__(self, keywords: List[str]):
+        self.variants: Dict[str, set] = defaultdict(set)
+        for keyword in keywords:
+            for variant in _deletions(keyword) | {keyword}:
+                self.variants[variant].add(keyword)
+
+    def matches(self, word: str) -> bool:
+        for variant in _deletions(word) | {word}:
+            for keyword in self.variants.get(variant, ()):
+                if _edit_distance(word, keyword, 1) <= 1:
+                    return True
+        return False
+
+qualifier_keywords = FuzzyKeywords(QUALIFIER_WORDS)
+advice_keywords = FuzzyKeywords(ADVICE_WORDS)
+instruction_keywords = FuzzyKeywords(INSTRUCTION_WORDS)
+
+def _has_fuzzy_word(text: str, keywords: FuzzyKeywords) -> bool:
+    words = {w.lower() for w in _word_regex.findall(text) if len(w) >= 4}
+    return any(keywords.matches(word) for word in words)
+
+def _has_unmatched_qualifier(text: str) -> bool:
+    return bool(_qualifier_regex.search(text)) or _has_fuzzy_word(text, qualifier_keywords)
+
+def _has_unmatched_advice(text: str) -> bool:
+    return bool(_advice_regex.search(text)) or _has_fuzzy_word(text, advice_keywords)
+
+def _has_unread_instructions(text: str) -> bool:
+    return (
+        _has_unmatched_qualifier(text) or _has_unmatched_advice(text) or
+        bool(_instruction_regex.search(text)) or _has_fuzzy_word(text, instruction_keywords)
+    )
+
+def _blank_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    for start, end in spans:
+        text = text[:start] + " " * (end - start) + text[end:]
+    return text
+
+def _repair_ocr_words(text: str) -> str:
+    """Undo digit-for-letter misreads inside words ("f0r", "SWA11OW"), leaving amounts like "50MG" alone"""
+    def repair(match: re.Match) -> str:
+        word = match.group(0)
+        if _amount_regex.match(word) or not any(c.isalpha() for c in word):
+            return word
+        return word.translate(OCR_CONFUSIONS)
+    return _word_regex.sub(repair, text)
+
+def parse_med_label(text: str, min_name_confidence: float = 0.8) -> Dict[str, str]:
+    """
+    Extract whichever fields can be read confidently from the label text. Keys that
+    could not be filled are left out, so the caller knows what to ask the LLM for.
+    """
+    text = _repair_ocr_words(text)
+    fields: Dict[str, str] = {}
+    name, confidence = _find_medicine_name(text)
+    if name and confidence >= min_name_confidence:
+        fields["medicine_name"] = name
+    dosage = _find_dosage(text)
+    if dosage:
+        fields["dosage"] = dosage
+
+    frequency, frequency_span = _find_frequency(text)
+    duration, duration_span = _find_duration(text)
+    notes, note_spans = _find_notes(text)
+    # "Three times daily as needed" or "for 2 weeks then TWO capsules" would lose their meaning if only
+    # the matched part were kept, so the regimen as a whole goes to the LLM. Notes already read
+    # ("STOP ONLY ON DOCTOR'S ADVICE") don't count as qualifiers.
+    if not _has_unmatched_qualifier(_blank_spans(text, [frequency_span, *note_spans])):
+        if frequency:
+            fields["frequency"] = frequency
+        if duration:
+            fields["duration"] = duration
+
+    if notes and not _has_unmatched_advice(_blank_spans(text, note_spans)):
+        fields["additional_notes"] = " ".join(notes)
+
+    # Only once every instruction on the label has been read does a missing duration or
+    # note mean the label has none; anything left unread goes to the LLM instead
+    if "frequency" in fields and not _has_unread_instructions(_blank_spans(text, [frequency_span, duration_span, *note_spans])):
+        fields.setdefault("duration", "No set duration")
+        fields.setdefault("additional_notes", "Not applicable")
+    return fields
@@ -0,0 +1,136 @@
+""" Content-addressed cache for OCR text and extracted medication info """
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class CacheBackend:
+    """TTL + LRU key/value store. Values must be JSON-serialisable."""
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entries: int, ttl: float):
+        super().__init__(max_entries, ttl)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class DiskCache(CacheBackend):
+    """SQLite-backed cache that survives restarts"""
+    def __init__(self, path: str, table: str, max_entries: int, ttl: float):
+        super().__init__(max_entries, ttl)
+        self.table = table
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def _set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+def image_key(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+_whitespace_regex = re.compile(r"\s+")
+
+def text_key(text: str) -> str:
+    """Hash of the OCR text with case and whitespace differences between scans normalised away"""
+    normalised = _whitespace_regex.sub(" ", text).strip().lower()
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+class OcrCache:
+    """
+    Two levels: image hash -> OCR text, and OCR text hash -> medication info.
+    Only hashes and derived text are stored, never the image itself.
+    """
+    def __init__(self, text_cache: CacheBackend, med_info_cache: CacheBackend):
+        self.text_cache = text_cache
+        self.med_info_cache = med_info_cache
+        self.stats: Dict[str, int] = {"text_hits": 0, "text_misses": 0, "med_info_hits": 0, "med_info_misses": 0}
+
+    async def _lookup(self, cache: CacheBackend, level: str, key: str) -> Optional[Any]:
+        value = await cache.get(key)
+        self.stats[f"{level}_hits" if value is not None else f"{level}_misses"] += 1
+        return value
+
+    async def get_text(self, image_bytes: bytes) -> Optional[str]:
+        return await self._lookup(self.text_cache, "text", image_key(image_bytes))
+
+    async def set_text(self, image_bytes: bytes, text: str) -> None:
+        await self.text_cache.set(image_key(image_bytes), text)
+
+    async def get_med_info(self, text: str) -> Optional[dict]:
+        return await self._lookup(self.med_info_cache, "med_info", text_key(text))
+
+    async def set_med_info(self, text: str, med_info: dict) -> None:
+        await self.med_info_cache.set(text_key(text), med_info)
+
+def create_ocr_cache(kind: str, path: str, max_entries: int, ttl: float) -> OcrCache:
+    if kind == "memory":
+        return OcrCache(MemoryCache(max_entries, ttl), MemoryCache(max_entries, ttl))
+    if kind == "disk":
+        return OcrCache(DiskCache(path, "ocr_text", max_entries, ttl), DiskCache(path, "med_info", max_entries, ttl))
+    raise ValueError(f"Unknown OCR cache backend: {kind}")
@@ -0,0 +1,76 @@
+""" Long-lived OCR client that runs the blocking SDK call off the event loop """
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import get_logger
+
+log = get_logger("ocr")
+
+def is_retryable(e: Exception) -> bool:
+    from huaweicloudsdkcore.exceptions import exceptions
+    # Not asyncio.TimeoutError: the abandoned SDK call is still running (and billed) in its
+    # worker thread, so a retry would pay twice and hold a second worker
+    if isinstance(e, (exceptions.ConnectionException, exceptions.RequestTimeoutException, exceptions.ServerResponseException)):
+        return True
+    # Throttled by the OCR service
+    return isinstance(e, exceptions.ClientRequestException) and e.status_code == 429
+
+class OcrService:
+    """
+    Runs `_recognize` in a bounded thread pool with a per-attempt timeout and
+    exponential backoff. Subclasses only implement the blocking call itself, and
+    should time out on their own before `timeout`, which is only a backstop.
+    """
+    def __init__(self, max_workers: int = 8, timeout: float = 15.0, max_retries: int = 2, backoff: float = 0.5):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _recognize(self, image_base64: str) -> str:
+        raise NotImplementedError
+
+    async def recognize_text(self, image_base64: str) -> str:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(self.executor, self._recognize, image_base64), self.timeout)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                log.warning("OCR attempt failed, retrying", extra={"attempt": attempt + 1, "error_type": type(e).__name__, "delay_s": round(delay, 2)})
+                await asyncio.sleep(delay)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class HuaweiOcrService(OcrService):
+    def __init__(self, ak: str, sk: str, region: str = "ap-southeast-1", **kwargs):
+        super().__init__(**kwargs)
+        # The SDK is slow to import, so only pay for it when the real backend is used
+        from huaweicloudsdkcore.auth.credentials import BasicCredentials
+        from huaweicloudsdkcore.http.http_config import HttpConfig
+        from huaweicloudsdkocr.v1.region.ocr_region import OcrRegion
+        from huaweicloudsdkocr.v1 import OcrClient
+        http_config = HttpConfig.get_default_config()
+        # The SDK's own timeouts fire before ours, so a slow call ends its worker thread with a retryable error
+        connect_timeout = min(5.0, self.timeout / 4)
+        http_config.timeout = (connect_timeout, max(1.0, self.timeout - connect_timeout - 1.0))
+        # One client for the app's lifetime, so its HTTP session (and TLS connections) get reused
+        self.client = OcrClient.new_builder() \
+            .with_credentials(BasicCredentials(ak, sk)) \
+            .with_region(OcrRegion.value_of(region)) \
+            .with_http_config(http_config) \
+            .build()
+
+    def _recognize(self, image_base64: str) -> str:
+        from huaweicloudsdkocr.v1 import RecognizeGeneralTextRequest, GeneralTextRequestBody
+        request = RecognizeGeneralTextRequest()
+        request.body = GeneralTextRequestBody(
+            image = image_base64,
+            detect_direction = True
+        )
+        response = self.client.recognize_general_text(request)
+        words_block_list = response.result.words_block_list
+        return " ".join(block.words for block in words_block_list)
@@ -0,0 +1,138 @@
+""" Cheap local first stage for the LLM evaluator """
+import re
+from typing import Dict, Optional, Sequence, Tuple
+
+# Red-flag content in either the user's message or the proposed response. Any match
+# always escalates to the LLM evaluator, which decides whether the reply handles it safely.
+SAFETY_PATTERNS = [
+    r"\bsuicid\w*",
+    r"\bkill(ing)?\s+(my\s*self|myself)\b",
+    r"\bend(ing)?\s+(it\s+all|my\s+life|things)\b",
+    r"\b(want|wanna|going)\s+to\s+die\b",
+    r"\bdon'?t\s+want\s+to\s+(live|be\s+here|exist|wake\s+up)\b",
+    r"\bno\s+(reason|point)\s+(to|in)\s+(live|living|going\s+on)\b",
+    r"\bbetter\s+off\s+(dead|without\s+me)\b",
+    r"\bself[\s-]?harm\w*",
+    r"\b(hurt|harm|cut|cutting|burn|burning)\s+(my\s*self|myself)\b",
+    r"\boverdos\w*",
+    r"\b(took|take|taking|swallow\w*)\s+(all|a\s+lot\s+of|too\s+many)\s+(my\s+|of\s+my\s+)?(pills|meds|medication|tablets)\b",
+    # Slang and method terms young people actually use
+    r"\bk[ms]s\b",
+    r"\bun[\s-]?aliv\w*",
+    r"\bsewer\s*slide\b",
+    r"\bend\s+(my\s*self|myself)\b",
+    r"\bhang(ing|ed)?\s+(my\s*self|myself)\b",
+    r"\bjump(ing|ed)?\s+(off|from|in\s+front\s+of)\b",
+    r"\b(wish|rather|wanna|want\s+to)\s+(i\s+)?(was|were|be)\s+dead\b",
+    r"\bwish\s+i\s+(was|were)\s*n[o']?t\s+(alive|here|born)\b",
+    r"\b(not|isn'?t|ain'?t)\s+worth\s+living\b",
+    r"\b(can'?t|cannot|can\s+not)\s+(go\s+on|keep\s+going|do\s+this|take\s+(it|this))(\s+any\s*more)?\b",
+    r"\b(want|wanna|going|wish\s+i\s+could)\s+(to\s+)?disappear\w*",
+    r"\bdisappear\s+(forever|for\s+good)\b",
+    r"\b(took|take|taking|swallow\w*|popped)\s+(like\s+)?(\d{2,}|ten|fifteen|twenty|thirty|forty|fifty|a\s+hundred)\s+(of\s+)?(my\s+|the\s+)?(pills|meds|tablets|capsules)\b",
+    r"\b(took|take|taking|swallow\w*)\s+(a|the)\s+(whole\s+)?(bottle|box|pack|packet|strip)\b",
+    r"\b(abuse|abused|abusing|assault\w*|rape\w*)\b",
+    r"\b(kill|hurt)\s+(him|her|them|someone|somebody|people)\b",
+]
+
+# Dosing advice the companion must never give on its own
+RESPONSE_RISK_PATTERNS = [
+    r"\b(double|increase|decrease|reduce|skip|halve)\s+(up\s+)?(on\s+)?(the|your)\s+(dose|dosage|meds|medication)\b",
+    r"\bstop\s+taking\s+(it|them|the|your)\b",
+    r"\btake\s+(an\s+)?(extra|more|another)\s+(dose|pill|tablet)\b",
+]
+
+# Abbreviations whose trailing period does not end a sentence
+ABBREVIATIONS = ["e.g.", "i.e.", "etc.", "vs.", "dr.", "mr.", "mrs.", "ms.", "st.", "no.", "approx."]
+
+_safety_regex = re.compile("|".join(SAFETY_PATTERNS), re.IGNORECASE)
+_response_risk_regex = re.compile("|".join(RESPONSE_RISK_PATTERNS), re.IGNORECASE)
+_abbreviation_regex = re.compile("|".join(re.escape(a) for a in ABBREVIATIONS), re.IGNORECASE)
+_decimal_regex = re.compile(r"(?<=\d)\.(?=\d)")
+_ellipsis_regex = re.compile(r"\.{2,}|…")
+_sentence_end_regex = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s|$)")
+_list_regex = re.compile(r"^\s*([-*•]|\d+[.)])\s+", re.MULTILINE)
+_word_regex = re.compile(r"\w")
+_dosage_regex = re.compile(r"\b\d+(\.\d+)?\s*(mg|mcg|ml|g)\b", re.IGNORECASE)
+
+def count_sentences(text: str) -> int:
+    """Deterministic sentence count, ignoring periods in abbreviations, decimals and ellipses"""
+    masked = _abbreviation_regex.sub(lambda m: m.group(0).replace(".", ""), text)
+    masked = _decimal_regex.sub("", masked)
+    masked = _ellipsis_regex.sub(",", masked)
+    masked = masked.strip()
+    if not masked:
+        return 0
+    ends = list(_sentence_end_regex.finditer(masked))
+    # Trailing text without closing punctuation is still a sentence
+    tail = masked[ends[-1].end():] if ends else masked
+    return len(ends) + (1 if _word_regex.search(tail) else 0)
+
+def needs_revision(evaluation_result: dict) -> bool:
+    """Whether an evaluation, from the LLM evaluator or the pre-screen, sends the reply to the revisor"""
+    return (
+        not evaluation_result["emotional_tone"] or
+        not evaluation_result["helpful"] or
+        evaluation_result["safety_concern"] or
+        not evaluation_result["conciseness_length"]
+    )
+
+def _is_mostly_latin(text: str) -> bool:
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return True
+    return sum(1 for c in letters if c.isascii()) / len(letters) > 0.9
+
+class ResponsePreScreener:
+    """
+    Returns an evaluator-shaped verdict for responses that are clearly fine (or
+    clearly too long), and None when the LLM evaluator should make the call.
+    """
+    def __init__(self):
+        self.stats: Dict[str, int] = {"screened": 0, "hits": 0, "escalations": 0}
+
+    def _escalate(self, reason: str) -> Tuple[Optional[dict], str]:
+        self.stats["escalations"] += 1
+        key = f"escalated_{reason}"
+        self.stats[key] = self.stats.get(key, 0) + 1
+        return None, reason
+
+    def screen(self, user_msg: str, response: str, recent_user_msgs: Sequence[str] = ()) -> Tuple[Optional[dict], str]:
+        """`recent_user_msgs` are the user's previous messages; a red flag there still needs the evaluator's judgement"""
+        self.stats["screened"] += 1
+
+        if _safety_regex.search(user_msg) or _safety_regex.search(response):
+            return self._escalate("safety_lexicon")
+        if any(_safety_regex.search(msg) for msg in recent_user_msgs):
+            return self._escalate("safety_context")
+        if _response_risk_regex.search(response):
+            return self._escalate("dosing_advice")
+        if not response.strip():
+            return self._escalate("empty_response")
+        # The sentence counter and lexicon are English-only
+        if not _is_mostly_latin(user_msg) or not _is_mostly_latin(response):
+            return self._escalate("non_english")
+        # Lists and specific doses need a judgement on helpfulness and accuracy
+        if _list_regex.search(response):
+            return self._escalate("list_formatting")
+        if _dosage_regex.search(response):
+            return self._escalate("dosage_mentioned")
+
+        sentences = count_sentences(response)
+        concise = 1 <= sentences <= 3
+        self.stats["hits"] += 1
+        return {
+            "emotional_tone": True,
+            "helpful": True,
+            "safety_concern": False,
+            "conciseness_length": concise,
+            "comments": {
+                "emotional_tone": "Not assessed by pre-screen.",
+                "helpful": "Not assessed by pre-screen.",
+                "safety_concern": "Pre-screen found no red-flag content.",
+                "conciseness_length": f"The chatbot response is {sentences} sentences long."
+            }
+        }, "local"
+
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["screened"] if self.stats["screened"] else 0.0
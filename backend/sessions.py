@@ -0,0 +1,126 @@
+""" Server-side chat sessions, keyed by user_id """
+import os
+import json
+import asyncio
+import hashlib
+from typing import Dict, List, Tuple
+from pydantic import BaseModel
+
+class ChatSession(BaseModel):
+    user_id: str
+    # Rolling summary of every turn that has been compacted out of `turns`
+    summary: str = ""
+    turns: List[Tuple[str, str]] = []
+    # Token count of each entry in `turns`, so the budget check never re-encodes old turns
+    turn_tokens: List[int] = []
+
+    def history_tokens(self) -> int:
+        return sum(self.turn_tokens)
+
+class SessionStore:
+    """Base class for session storage backends"""
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def lock(self, user_id: str) -> asyncio.Lock:
+        """Per-user lock so concurrent turns from the same user don't clobber each other"""
+        if user_id not in self._locks:
+            self._locks[user_id] = asyncio.Lock()
+        return self._locks[user_id]
+
+    async def get(self, user_id: str) -> ChatSession:
+        raise NotImplementedError
+
+    async def save(self, session: ChatSession) -> None:
+        raise NotImplementedError
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self):
+        super().__init__()
+        self._sessions: Dict[str, ChatSession] = {}
+
+    async def get(self, user_id: str) -> ChatSession:
+        session = self._sessions.get(user_id)
+        return session.model_copy(deep=True) if session else ChatSession(user_id=user_id)
+
+    async def save(self, session: ChatSession) -> None:
+        self._sessions[session.user_id] = session.model_copy(deep=True)
+
+class FileSessionStore(SessionStore):
+    """Stores one JSON file per user so sessions survive restarts"""
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: str) -> str:
+        # Hashed so distinct ids can never collide on one file, whatever characters they use
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _read(self, user_id: str) -> ChatSession:
+        try:
+            with open(self._path(user_id), "r", encoding="utf-8") as f:
+                return ChatSession.model_validate(json.load(f))
+        except FileNotFoundError:
+            return ChatSession(user_id=user_id)
+
+    def _write(self, session: ChatSession) -> None:
+        path = self._path(session.user_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(session.model_dump_json())
+        os.replace(tmp_path, path)
+
+    async def get(self, user_id: str) -> ChatSession:
+        return await asyncio.to_thread(self._read, user_id)
+
+    async def save(self, session: ChatSession) -> None:
+        await asyncio.to_thread(self._write, session)
+
+def create_session_store(kind: str, path: str) -> SessionStore:
+    if kind == "memory":
+        return InMemorySessionStore()
+    if kind == "file":
+        return FileSessionStore(path)
+    raise ValueError(f"Unknown session store: {kind}")
+
+_encoding = None
+
+def load_token_encoding() -> None:
+    """
+    Load the tokenizer (which may download its BPE file). Blocking, so the app calls
+    it from a thread at startup; count_tokens only falls back to it when that hasn't run.
+    """
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.encoding_for_model("gpt-4o")
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        load_token_encoding()
+    return len(_encoding.encode(text))
+
+def count_turn_tokens(turn: Tuple[str, str]) -> int:
+    human, ai = turn
+    return count_tokens(human) + count_tokens(ai)
+
+def append_turn(session: ChatSession, human: str, ai: str) -> None:
+    session.turns.append((human, ai))
+    session.turn_tokens.append(count_turn_tokens((human, ai)))
+
+def pop_turns_over_budget(session: ChatSession, budget: int, target: int) -> List[Tuple[str, str]]:
+    """
+    Once the history is over `budget` tokens, remove the oldest turns until it is
+    at or under `target` and return them for summarisation. Compacting down to a
+    lower target means the summary is only recomputed every few turns.
+    """
+    if session.history_tokens() <= budget:
+        return []
+    evicted = []
+    # Always keep the latest turn verbatim
+    while len(session.turns) > 1 and session.history_tokens() > target:
+        evicted.append(session.turns.pop(0))
+        session.turn_tokens.pop(0)
+    return evicted
@@ -0,0 +1,176 @@
+""" Structured logging, per-stage latency histograms and counters, exported in Prometheus text format """
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from contextlib import asynccontextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# User messages, bot replies, OCR text and evaluator comments are only logged verbatim when this is on
+LOG_USER_CONTENT = os.getenv("LOG_USER_CONTENT", "false").lower() == "true"
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+
+# Seconds; LLM stages take a few seconds, local stages a few milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with anything passed via `extra` as top-level fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging() -> logging.Logger:
+    """
+    Log through a queue so request handlers never block on stdout; a background
+    thread does the actual writes.
+    """
+    logger = logging.getLogger("mindoasis")
+    if logger.handlers:
+        return logger
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"mindoasis.{name}")
+
+def redact(value) -> object:
+    """Replace user-derived content with its size, unless LOG_USER_CONTENT is set"""
+    if LOG_USER_CONTENT:
+        return value
+    if isinstance(value, str):
+        return f"<redacted {len(value)} chars>"
+    if isinstance(value, dict):
+        # Keep booleans (e.g. evaluator verdicts), redact free text
+        return {k: v if isinstance(v, (bool, int, float)) or v is None else redact(v) for k, v in value.items()}
+    return "<redacted>"
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # Per label set: cumulative bucket counts, then sum and count
+        self.values: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+stage_duration = Histogram("mindoasis_stage_duration_seconds", "Time spent in each pipeline stage")
+stage_errors = Counter("mindoasis_stage_errors_total", "Pipeline stages that raised")
+revisions_triggered = Counter("mindoasis_revisions_triggered_total", "Chatbot responses sent to the revisor")
+evaluator_fallbacks = Counter("mindoasis_evaluator_fallbacks_total", "LLM evaluator failures that passed the response unchecked")
+metrics = [stage_duration, stage_errors, revisions_triggered, evaluator_fallbacks]
+
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        # Exporter endpoint comes from the standard OTEL_EXPORTER_OTLP_ENDPOINT variable
+        provider = TracerProvider(resource=Resource.create({"service.name": "mindoasis-backend"}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("mindoasis")
+    except ImportError:
+        get_logger("telemetry").warning("OTEL_ENABLED is set but opentelemetry is not installed, spans are disabled")
+
+@asynccontextmanager
+async def stage(name: str, **attributes):
+    """Time a pipeline stage into the stage histogram, inside an OpenTelemetry span when enabled"""
+    span = _tracer.start_as_current_span(name, attributes=attributes) if _tracer else nullcontext()
+    with span:
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            stage_errors.inc(stage=name)
+            raise
+        finally:
+            stage_duration.observe(time.perf_counter() - started, stage=name)
+
+def render_metrics(usage_totals: Dict[str, Dict[str, int]], gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """
+    Prometheus text exposition of the stage metrics, the token usage totals from
+    usage.py, and any component stats passed in as `gauges` (name -> {stat: value}).
+    """
+    lines: List[str] = []
+    for metric in metrics:
+        lines += metric.render()
+    lines += ["# HELP mindoasis_llm_tokens_total Tokens reported by OpenAI, per chain", "# TYPE mindoasis_llm_tokens_total counter"]
+    for chain, bucket in usage_totals.items():
+        for kind in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens"):
+            lines.append(f'mindoasis_llm_tokens_total{{chain="{chain}",kind="{kind[:-len("_tokens")]}"}} {bucket[kind]}')
+    lines += ["# HELP mindoasis_llm_calls_total LLM calls that reported usage, per chain", "# TYPE mindoasis_llm_calls_total counter"]
+    lines += [f'mindoasis_llm_calls_total{{chain="{chain}"}} {bucket["calls"]}' for chain, bucket in usage_totals.items()]
+    for component, stats in (gauges or {}).items():
+        name = f"mindoasis_{component}"
+        lines += [f"# TYPE {name} gauge"]
+        lines += [f'{name}{{stat="{stat}"}} {value}' for stat, value in stats.items()]
+    return "\n".join(lines) + "\n"
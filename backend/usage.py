@@ -0,0 +1,56 @@
+""" Token usage accounting per request and per chain, including provider prompt-cache hits """
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_request_usage: ContextVar[Optional[Dict[str, Dict[str, int]]]] = ContextVar("request_usage", default=None)
+
+# Running totals since startup, keyed by chain name
+usage_totals: Dict[str, Dict[str, int]] = {}
+
+def _empty_usage() -> Dict[str, int]:
+    return {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "uncached_prompt_tokens": 0, "completion_tokens": 0}
+
+def start_request_usage() -> Dict[str, Dict[str, int]]:
+    """Begin collecting usage for the current request; LLM calls awaited from here on record into it"""
+    usage = {}
+    _request_usage.set(usage)
+    return usage
+
+def record_usage(chain: str, message) -> None:
+    """Record the usage metadata OpenAI attached to an AIMessage (or aggregated AIMessageChunk)"""
+    metadata = getattr(message, "usage_metadata", None)
+    if not metadata:
+        return
+    prompt_tokens = metadata.get("input_tokens", 0)
+    cached_tokens = (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+    completion_tokens = metadata.get("output_tokens", 0)
+
+    buckets = [usage_totals.setdefault(chain, _empty_usage())]
+    request_usage = _request_usage.get()
+    if request_usage is not None:
+        buckets.append(request_usage.setdefault(chain, _empty_usage()))
+    for bucket in buckets:
+        bucket["calls"] += 1
+        bucket["prompt_tokens"] += prompt_tokens
+        bucket["cached_prompt_tokens"] += cached_tokens
+        bucket["uncached_prompt_tokens"] += prompt_tokens - cached_tokens
+        bucket["completion_tokens"] += completion_tokens
+
+def format_usage(usage: Dict[str, Dict[str, int]]) -> str:
+    parts = []
+    for chain, bucket in usage.items():
+        parts.append(
+            f"{chain}: prompt={bucket['prompt_tokens']} cached={bucket['cached_prompt_tokens']} "
+            f"uncached={bucket['uncached_prompt_tokens']} completion={bucket['completion_tokens']}"
+        )
+    return "; ".join(parts) if parts else "no usage reported"
+
+def average_call_tokens(chain: str, default: int) -> int:
+    """Mean prompt plus completion tokens per call of `chain` so far, `default` before its first call"""
+    bucket = usage_totals.get(chain)
+    if not bucket or not bucket["calls"]:
+        return default
+    return (bucket["prompt_tokens"] + bucket["completion_tokens"]) // bucket["calls"]
+
+def cache_hit_rate(bucket: Dict[str, int]) -> float:
+    return bucket["cached_prompt_tokens"] / bucket["prompt_tokens"] if bucket["prompt_tokens"] else 0.0